@@ -1,10 +1,144 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import streamlit as st
-import openrouteservice
-from openrouteservice import exceptions
+from api_cache import SQLiteCache, MISSING
+from ors_client import RateLimitedClient, TokenBucket, make_client
+from autocomplete_index import PrefixIndex, normalize
+import metrics
+from metrics import registry, timed
 
-# OpenRouteService-Client mit API-Schlüssel initialisieren
-client = openrouteservice.Client(key=st.secrets["API_KEY"])
+logger = logging.getLogger(__name__)
 
+# Anzahl gleichzeitiger Anfragen (Threads und Keep-Alive-Verbindungen)
+ORS_WORKERS = int(os.environ.get("ORS_WORKERS", 8))
+
+# OpenRouteService-Client wird erst bei der ersten Anfrage erstellt (schnellerer Start; Tests können client direkt setzen)
+client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """
+    Return the shared OpenRouteService client, creating it on first use.
+
+    The API key comes from ORS_API_KEY or, without it, from the Streamlit
+    secret API_KEY. Requests are rate limited to the free ORS plan quotas
+    and retried on transient errors.
+
+    Returns:
+        RateLimitedClient: The client.
+    """
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                client = RateLimitedClient(
+                    make_client(os.environ.get("ORS_API_KEY") or st.secrets["API_KEY"], pool_size=ORS_WORKERS),
+                    {
+                        "default": TokenBucket(float(os.environ.get("ORS_RATE_PER_MINUTE", 40)), burst=10),    # Routen und Matrix
+                        "pelias_search": TokenBucket(float(os.environ.get("ORS_GEOCODE_RATE_PER_MINUTE", 100)), burst=20),
+                        "pelias_autocomplete": TokenBucket(float(os.environ.get("ORS_GEOCODE_RATE_PER_MINUTE", 100)), burst=20),
+                    },
+                    max_elapsed=float(os.environ.get("ORS_MAX_CALL_SECONDS", 30))    # Obergrenze für Wiederholungen pro Anfrage
+                )
+    return client
+
+_pool = ThreadPoolExecutor(max_workers=ORS_WORKERS)    # Für parallele Geocoding-Anfragen
+
+# Gemeinsamer Cache für Geocoding-Antworten, über Umgebungsvariablen einstellbar
+cache = SQLiteCache(
+    os.environ.get("ORS_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ors_cache.sqlite3")),
+    max_entries=int(os.environ.get("ORS_CACHE_MAX_ENTRIES", 10000)),
+    ttl=float(os.environ.get("ORS_CACHE_TTL", 7 * 24 * 3600)),    # Standard: eine Woche
+    touch_interval=float(os.environ.get("ORS_CACHE_TOUCH_INTERVAL", 60))    # Seltener schreiben = weniger Sperren bei vielen Prozessen
+)
+
+# Lokaler Präfix-Index für die Autovervollständigung (pro Prozess, von allen Sitzungen geteilt)
+AUTOCOMPLETE_MIN_CHARS = int(os.environ.get("ORS_AUTOCOMPLETE_MIN_CHARS", 3))    # Kürzere Eingaben lösen keine Anfrage aus
+prefix_index = PrefixIndex(
+    page_size=10,    # Standardanzahl der Vorschläge von Pelias
+    min_results=int(os.environ.get("ORS_AUTOCOMPLETE_MIN_RESULTS", 3)),
+    debounce=float(os.environ.get("ORS_AUTOCOMPLETE_DEBOUNCE", 1.0))
+)
+
+# Routen werden nach gerundeten Koordinaten zwischengespeichert (5 Nachkommastellen ≈ 1 m)
+ROUTE_CACHE_PRECISION = int(os.environ.get("ORS_ROUTE_CACHE_PRECISION", 5))
+# Höchstzahl von Start-Ziel-Paaren pro Matrix-Anfrage (Limit des öffentlichen ORS-Plans)
+MATRIX_MAX_ELEMENTS = int(os.environ.get("ORS_MATRIX_MAX_ELEMENTS", 3500))
+
+# Trefferquoten der Caches für den Metrik-Export
+registry.register_gauge("co2_ors_cache_hit_ratio", lambda: {(): cache.stats()["hit_ratio"]})
+registry.register_gauge("co2_ors_cache_entries", lambda: {(): cache.stats()["entries"] or 0})
+registry.register_gauge("co2_ors_cache_requests", lambda: {
+    (("result", "hit"),): cache.hits,
+    (("result", "miss"),): cache.misses,
+})
+registry.register_gauge("co2_autocomplete_prefix_requests", lambda: {
+    (("source", "local"),): prefix_index.local_hits,
+    (("source", "remote"),): prefix_index.remote_calls,
+})
+
+# Optionales Offline-Routing: Verzeichnis eines mit local_routing.py gebauten Straßengraphen
+LOCAL_GRAPH = os.environ.get("CO2_LOCAL_GRAPH")
+_local_router = None
+_local_router_lock = threading.Lock()
+
+def set_local_router(router):
+    """
+    Replace the offline routing backend.
+
+    Parameters:
+        router: Object with a route(start_coords, end_coords) method returning
+                the same dict as get_route_info (or None), e.g.
+                local_routing.LocalRouter. None switches offline routing off.
+    """
+    global _local_router
+    _local_router = router
+
+def _get_local_router():
+    global _local_router
+    if _local_router is None and LOCAL_GRAPH:
+        with _local_router_lock:    # Den Graphen nur einmal pro Prozess laden
+            if _local_router is None:
+                from local_routing import LocalRouter
+                _local_router = LocalRouter(LOCAL_GRAPH)
+    return _local_router
+
+def _cache_key(text):
+    return " ".join(str(text).split()).casefold()    # Leerzeichen und Groß-/Kleinschreibung ändern das Ergebnis nicht
+
+@timed("Map_API.pelias_search")
+def pelias_search(text):
+    """
+    Run an OpenRouteService geocoding search through the shared cache.
+
+    Parameters:
+        text (str): Address to search for.
+
+    Returns:
+        dict: GeoJSON response of the search endpoint.
+    """
+    return cache.get_or_call("search", _cache_key(text), lambda: get_client().pelias_search(text=text))
+
+@timed("Map_API.pelias_autocomplete")
+def pelias_autocomplete(text):
+    """
+    Run an OpenRouteService autocomplete request through the shared cache.
+
+    Parameters:
+        text (str): Partial address.
+
+    Returns:
+        dict: GeoJSON response of the autocomplete endpoint.
+    """
+    def fetch():
+        prefix_index.count_remote_call()    # Nur echte ORS-Anfragen zählen, keine Treffer im SQLite-Cache
+        return get_client().pelias_autocomplete(text=text)
+    return cache.get_or_call("autocomplete", _cache_key(text), fetch)
+
+@timed("Map_API.get_coordinates")
 def get_coordinates(address):
     """
     Geocode a full address into longitude and latitude coordinates.
@@ -19,12 +153,13 @@ def get_coordinates(address):
         RuntimeError: If the geocoding fails.
     """
     try:
-        result = client.pelias_search(text=address)
+        result = pelias_search(address)
         coords = result['features'][0]['geometry']['coordinates']
         return coords
     except Exception as e:
         raise RuntimeError(f"Could not geocode address '{address}': {e}")
 
+@timed("Map_API.autocomplete_address")
 def autocomplete_address(partial_text):
     """
     Suggest possible address completions for a given partial input.
@@ -33,45 +168,156 @@ def autocomplete_address(partial_text):
         partial_text (str): The beginning of an address or location name.
 
     Returns:
-        list: A list of suggested full address strings.
+        list: A list of suggested full address strings. Empty if the input
+              is shorter than AUTOCOMPLETE_MIN_CHARS.
 
     Raises:
         RuntimeError: If the autocomplete request fails.
     """
+    if len(normalize(partial_text)) < AUTOCOMPLETE_MIN_CHARS:
+        return []    # Zu kurz für sinnvolle Vorschläge
+    local = prefix_index.lookup(partial_text)
+    if local is not None:
+        return local    # Aus früheren Antworten für ein kürzeres Präfix gefiltert
     try:
-        result = client.pelias_autocomplete(text=partial_text)
+        result = pelias_autocomplete(partial_text)
         suggestions = [feature['properties']['label'] for feature in result['features']]
+        prefix_index.add(partial_text, suggestions)
         return suggestions
     except Exception as e:
         raise RuntimeError(f"Autocomplete failed: {e}")
 
-def get_route_info(start_coords, end_coords):
+def _route_key(start_coords, end_coords, profile):
+    rounded = [round(float(v), ROUTE_CACHE_PRECISION) for v in [*start_coords, *end_coords]]
+    return f"{profile}:" + ",".join(f"{v:.{ROUTE_CACHE_PRECISION}f}" for v in rounded)
+
+@timed("Map_API.get_route_info")
+def get_route_info(start_coords, end_coords, profile='driving-car'):
     """
     Calculate routing information between two geographic coordinates.
 
+    If an offline router is configured (CO2_LOCAL_GRAPH or
+    set_local_router), car routes are computed locally first and the API
+    is only used when the local graph has no answer. API results are
+    cached by coordinates rounded to ROUTE_CACHE_PRECISION decimal places,
+    so repeating a calculation does not call the API.
+
     Parameters:
         start_coords (list): [longitude, latitude] of the starting point.
         end_coords (list): [longitude, latitude] of the destination.
+        profile (str): OpenRouteService routing profile.
 
     Returns:
         dict: A dictionary with route distance in kilometers, 
-              duration in minutes, and route geometry (polyline coordinates).
+              duration in minutes, route geometry (polyline coordinates)
+              and the route steps as [first way point, last way point,
+              duration in seconds] (indices into the geometry).
 
     Returns None if an OpenRouteService API error occurs.
     """
+    router = _get_local_router() if profile == 'driving-car' else None
+    if router is not None:
+        info = router.route(start_coords, end_coords)
+        if info is not None:
+            return info    # Lokal berechnet, ohne Netzwerk und Kontingent
+        if metrics.ENABLED:
+            registry.inc("co2_local_routing_misses_total")
+    key = _route_key(start_coords, end_coords, profile)
+    cached = cache.get("route", key)
+    if cached is not MISSING:
+        return cached    # Gleiche Strecke wurde schon berechnet
+    from openrouteservice import exceptions
     try:
-        route = client.directions(
+        route = get_client().directions(
             coordinates=[start_coords, end_coords],
-            profile='driving-car',     # Verkehrsmittel
+            profile=profile,           # Verkehrsmittel
             format='geojson'           # Ausgabeformat
         )
         segment = route['features'][0]['properties']['segments'][0]
         geometry = route['features'][0]['geometry']['coordinates']
-        return {
+        info = {
             "distance_km": segment['distance'] / 1000,     # Meter in Kilometer umrechnen
             "duration_min": segment['duration'] / 60,      # Sekunden in Minuten umrechnen
-            "geometry": geometry                           # Liste der [lon, lat]-Punkte entlang der Route
+            "geometry": geometry,                          # Liste der [lon, lat]-Punkte entlang der Route
+            "steps": [                                     # Fahrtabschnitte mit eigener Dauer, für Geschwindigkeiten entlang der Route
+                [step['way_points'][0], step['way_points'][1], step['duration']]
+                for step in segment.get('steps', [])
+            ]
         }
     except exceptions.ApiError as e:
-        print(f"OpenRouteService API Error: {e}")
+        if metrics.ENABLED:
+            registry.inc("co2_route_failures_total", endpoint="directions", status=e.status)
+        logger.warning("OpenRouteService API error (%s): %s", "directions", e)
+        return None
+    cache.set("route", key, info)    # Fehler werden nicht gespeichert
+    return info
+
+@timed("Map_API.resolve_route")
+def resolve_route(start_address, end_address):
+    """
+    Geocode two addresses in parallel and calculate the route between them.
+
+    Parameters:
+        start_address (str): Full starting address.
+        end_address (str): Full destination address.
+
+    Returns:
+        tuple: (start_coords, end_coords, route) where route is the result
+               of get_route_info (None on an API error).
+
+    Raises:
+        RuntimeError: If geocoding fails.
+    """
+    start_future = _pool.submit(get_coordinates, start_address)    # Start im Hintergrund geocodieren
+    end_coords = get_coordinates(end_address)    # ... während das Ziel hier geocodiert wird
+    start_coords = start_future.result()
+    return start_coords, end_coords, get_route_info(start_coords, end_coords)
+
+@timed("Map_API.get_distance_matrix")
+def get_distance_matrix(origins, destinations, profile='driving-car'):
+    """
+    Calculate distances and durations for every origin-destination pair.
+
+    The pairs are split into blocks of at most MATRIX_MAX_ELEMENTS so that
+    each request stays within the OpenRouteService matrix limits.
+
+    Parameters:
+        origins (list): [longitude, latitude] of each starting point.
+        destinations (list): [longitude, latitude] of each destination.
+        profile (str): OpenRouteService routing profile.
+
+    Returns:
+        dict: 'distance_km' and 'duration_min' as arrays of shape
+              (len(origins), len(destinations)). Unroutable pairs are NaN.
+
+    Returns None if an OpenRouteService API error occurs.
+    """
+    origins = [list(map(float, c)) for c in origins]
+    destinations = [list(map(float, c)) for c in destinations]
+    distance_km = np.full((len(origins), len(destinations)), np.nan)
+    duration_min = np.full((len(origins), len(destinations)), np.nan)
+    dest_step = max(1, min(len(destinations), MATRIX_MAX_ELEMENTS))    # So viele Ziele wie möglich pro Anfrage
+    origin_step = max(1, MATRIX_MAX_ELEMENTS // dest_step)
+    from openrouteservice import exceptions
+    try:
+        for i in range(0, len(origins), origin_step):
+            o_chunk = origins[i:i + origin_step]
+            for j in range(0, len(destinations), dest_step):
+                d_chunk = destinations[j:j + dest_step]
+                result = get_client().distance_matrix(
+                    locations=o_chunk + d_chunk,
+                    profile=profile,
+                    sources=list(range(len(o_chunk))),
+                    destinations=list(range(len(o_chunk), len(o_chunk) + len(d_chunk))),
+                    metrics=['distance', 'duration'],
+                    units='m'
+                )
+                # None (keine Route) wird zu NaN
+                distance_km[i:i + len(o_chunk), j:j + len(d_chunk)] = np.array(result['distances'], dtype=float) / 1000
+                duration_min[i:i + len(o_chunk), j:j + len(d_chunk)] = np.array(result['durations'], dtype=float) / 60
+    except exceptions.ApiError as e:
+        if metrics.ENABLED:
+            registry.inc("co2_route_failures_total", endpoint="matrix", status=e.status)
+        logger.warning("OpenRouteService API error (%s): %s", "matrix", e)
         return None
+    return {"distance_km": distance_km, "duration_min": duration_min}
@@ -0,0 +1,162 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Markiert einen Cache-Fehltreffer (None kann ein gültiger Wert sein)
+MISSING = object()
+
+
+class SQLiteCache:
+    """
+    Small persistent key-value cache shared by all processes on one machine.
+
+    Values are stored as JSON in a SQLite file. The cache holds at most
+    max_entries rows, evicts the least recently used ones first and treats
+    rows older than ttl seconds as missing. Any database error is handled
+    as a miss, so the cache can never break the app. The access time used
+    for eviction is only refreshed when it is older than touch_interval
+    seconds, so most hits are read-only and do not take the write lock.
+
+    Parameters:
+        path (str): Location of the SQLite file.
+        max_entries (int): Maximum number of stored entries.
+        ttl (float): Time to live of an entry in seconds.
+        touch_interval (float): Minimum age in seconds of the stored access
+            time before a hit updates it.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: float = 7 * 24 * 3600, touch_interval: float = 60):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()    # Eine Verbindung pro Thread (Streamlit nutzt einen Thread pro Sitzung)
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)    # Autocommit
+            conn.execute("PRAGMA journal_mode=WAL")    # Leser blockieren Schreiber aus anderen Prozessen nicht
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " created REAL NOT NULL, accessed REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, namespace: str, key: str):
+        """
+        Look up an entry.
+
+        Parameters:
+            namespace (str): Kind of entry, e.g. 'search'.
+            key (str): Key inside the namespace.
+
+        Returns:
+            The stored value, or MISSING if there is no fresh entry.
+        """
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, accessed FROM entries WHERE namespace = ? AND key = ? AND created > ?",
+                (namespace, key, now - self.ttl)
+            ).fetchone()
+        except sqlite3.Error:
+            row = None
+        if row is not None and row[1] < now - self.touch_interval:
+            try:
+                conn.execute(
+                    "UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ? AND accessed < ?",
+                    (now, namespace, key, now - self.touch_interval)
+                )    # Für LRU-Verdrängung den letzten Zugriff merken; selten, damit Treffer meist nur lesen
+            except sqlite3.Error:
+                pass    # Gesperrt: der Treffer bleibt gültig, nur die LRU-Zeit ist etwas älter
+        self._count(row is not None)
+        return MISSING if row is None else json.loads(row[0])
+
+    def set(self, namespace: str, key: str, value):
+        """
+        Store an entry and evict the least recently used ones if needed.
+
+        Parameters:
+            namespace (str): Kind of entry, e.g. 'search'.
+            key (str): Key inside the namespace.
+            value: JSON-serialisable value.
+        """
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), now, now)
+            )
+            excess = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries ORDER BY accessed LIMIT ?)",
+                    (excess,)
+                )    # Am längsten nicht benutzte Einträge entfernen
+        except sqlite3.Error:
+            pass    # Cache ist nur eine Beschleunigung; Fehler werden ignoriert
+
+    def get_or_call(self, namespace: str, key: str, fn):
+        """
+        Return the cached value or compute, store and return fn().
+
+        Parameters:
+            namespace (str): Kind of entry, e.g. 'search'.
+            key (str): Key inside the namespace.
+            fn (callable): Computes the value on a miss. Exceptions are not cached.
+
+        Returns:
+            The cached or freshly computed value.
+        """
+        value = self.get(namespace, key)
+        if value is MISSING:
+            value = fn()
+            self.set(namespace, key, value)
+        return value
+
+    def clear(self):
+        """Remove all entries."""
+        try:
+            self._connect().execute("DELETE FROM entries")
+        except sqlite3.Error:
+            pass
+
+    def stats(self) -> dict:
+        """
+        Report hit and miss counters of this process and the current size.
+
+        Returns:
+            dict: 'hits', 'misses', 'hit_ratio' and 'entries'.
+        """
+        try:
+            entries = self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "entries": entries,
+        }
@@ -1,9 +1,19 @@
+import time
+_script_start = time.perf_counter()  # Für die Messung der Zeit bis zur ersten Anzeige
+import os
 import streamlit as st
 import pandas as pd
 import numpy as np
-from Map_API import autocomplete_address, get_coordinates, get_route_info
-from ml_utils import train_model, predict_co2_emission
-from utils import load_vehicle_data, display_route_map
+from Map_API import autocomplete_address, resolve_route
+from ml_utils import train_model, predict_co2_emission, load_prediction_grid
+from utils import load_vehicle_data, load_vehicle_index, load_fleet_table, display_route_map, display_diagnostics
+from emissions import g_per_km, trip_emissions, rank_fleet, route_emission_profile
+from warmup import start_warmup, record_first_paint
+import metrics
+
+VEHICLE_CSV = "all-vehicles-model@public.csv"
+ROUTE_MEMO_SIZE = 5  # So viele berechnete Routen merkt sich jede Sitzung
+PROFILE_CHART_POINTS = 500  # Punkte im Diagramm des Emissionsverlaufs (die Route selbst kann viel mehr haben)
 
 # SEITENKONFIGURATION
 st.set_page_config(
@@ -11,6 +21,7 @@ st.set_page_config(
     page_icon="🚗",
     layout="centered"
 )
+start_warmup(VEHICLE_CSV)  # Fahrzeugdaten und Modell im Hintergrund laden, während die Seite schon angezeigt wird
 
 # Titel
 st.title("Car Journey CO₂ Emission Calculator")  # Haupttitel der App anzeigen
@@ -18,6 +29,8 @@ st.write("Welcome! This app will help you calculate and compare the carbon emiss
 
 # Seitenleiste: Eingabe der Reisedaten
 st.sidebar.header("Enter your trip information")  # Überschrift für den Seitenleistenabschnitt
+if metrics.ENABLED:
+    record_first_paint(time.perf_counter() - _script_start)  # Titel ist sichtbar; nur der erste Lauf im Prozess zählt, vor jeder ORS-Anfrage
 start_input = st.sidebar.text_input("From:")  # Textfeld für Startadresse
 selected_start = st.sidebar.selectbox(  
     "Select starting location:",  
@@ -32,13 +45,13 @@ selected_end = st.sidebar.selectbox(
 
 # Fahrzeugdaten laden und trainieren
 try:  
-    vehicle_df = load_vehicle_data("all-vehicles-model@public.csv")  # Lese & bereinige CSV
+    vehicle_df = load_vehicle_data(VEHICLE_CSV)  # Lese & bereinige CSV (wartet auf das Aufwärmen, falls es noch läuft)
+    vehicle_index = load_vehicle_index(VEHICLE_CSV)  # Vorberechneter Index Marke → Kraftstoff → Modell → Jahr
+    fleet = load_fleet_table(VEHICLE_CSV)  # g/km für den ganzen Katalog, für Vergleiche
 except Exception:  
     st.error("Could not load vehicle database.")  # Zeige Fehler, falls Laden fehlschlägt
     st.stop()  # Beende die App bei Fehler
 
-model, le = train_model(vehicle_df)  # Trainiere ML-Modell + Encoder für eigene CO₂-Vorhersagen
-
 # Seitenleiste: Fahrzeugauswahl oder eigene Eingabe
 st.sidebar.header("Select Your Vehicle")  # Überschrift für Fahrzeugauswahl
 car_not_listed = st.sidebar.checkbox("My car is not listed")  # Checkbox für "Auto nicht gelistet"
@@ -49,50 +62,59 @@ if car_not_listed:
     fuel_type = st.sidebar.selectbox("Fuel Type", vehicle_df["Fuel_Type1"].unique())  
     cylinders = st.sidebar.number_input("Number of Cylinders", min_value=3, max_value=16, step=1)  
     year = st.sidebar.number_input("Year", min_value=1980, max_value=2025, step=1) 
-    predicted_co2 = predict_co2_emission(model, le, fuel_type, cylinders, year)  # CO2 mit ML vorhersagen
-    st.sidebar.success(f"Predicted CO₂ Emission: {(predicted_co2/1.60934):.2f} g/km")  # Zeige CO2-Vorhersage an (geteilt durch 1,6, weil in der CSV pro Meile)
+    model, le = train_model(vehicle_df)  # ML-Modell + Encoder nur laden, wenn es gebraucht wird
+    grid = load_prediction_grid(model, le, id(model))  # Vorberechnete Vorhersagetabelle für alle Eingaben der Seitenleiste
+    predicted_co2 = predict_co2_emission(model, le, fuel_type, cylinders, year, grid=grid)  # CO2 mit ML vorhersagen
+    st.sidebar.success(f"Predicted CO₂ Emission: {g_per_km(predicted_co2):.2f} g/km")  # Zeige CO2-Vorhersage an (umgerechnet, weil in der CSV pro Meile)
     final_row = pd.Series({"Co2__Tailpipe_For_Fuel_Type1": predicted_co2})  # Einzelzeilen-Fallback, damit der Code mit ML-Vorhersage funktioniert, sonst würde er weiter unten nach final_row suchen
     selected_make, selected_model, selected_year, selected_fuel = "Custom", "Custom Entry", year, fuel_type  # Platzhalterwerte für Marke und Modell, damit der Code wie bei normaler Auswahl funktioniert
 else:
-    selected_make = st.sidebar.selectbox("Brand", sorted(vehicle_df["Make"].unique()))  # Auswahl der Marke in der Seitenleiste
-    df_m = vehicle_df[vehicle_df["Make"] == selected_make]  # Nach Marke filtern
-    selected_fuel = st.sidebar.selectbox("Fuel Type", sorted(df_m["Fuel_Type1"].unique()))  # Auswahl des Kraftstoffs in der Seitenleiste
-    df_f = df_m[df_m["Fuel_Type1"] == selected_fuel]  # Nach Kraftstoff filtern
-    selected_model = st.sidebar.selectbox("Model", sorted(df_f["Model"].unique()))  # Auswahl des Modells in der Seitenleiste
-    df_mod = df_f[df_f["Model"] == selected_model]  # Nach Modell filtern
-    selected_year = st.sidebar.selectbox(  
-        "Year",  
-        sorted(df_mod["Year"].unique(), reverse=True)  
-    )  # Auswahl des Baujahrs in der Seitenleiste
-    final_row = vehicle_df[  
-        (vehicle_df["Make"] == selected_make) &  
-        (vehicle_df["Fuel_Type1"] == selected_fuel) &  
-        (vehicle_df["Model"] == selected_model) &  
-        (vehicle_df["Year"] == selected_year)  
-    ]  # Suche nach der ausgewählten Zeile
+    selected_make = st.sidebar.selectbox("Brand", list(vehicle_index))  # Auswahl der Marke in der Seitenleiste (Schlüssel sind schon sortiert)
+    fuels = vehicle_index[selected_make]  # Kraftstoffe dieser Marke
+    selected_fuel = st.sidebar.selectbox("Fuel Type", list(fuels))  # Auswahl des Kraftstoffs in der Seitenleiste
+    models = fuels[selected_fuel]  # Modelle mit diesem Kraftstoff
+    selected_model = st.sidebar.selectbox("Model", list(models))  # Auswahl des Modells in der Seitenleiste
+    years = models[selected_model]  # Baujahre dieses Modells, absteigend
+    selected_year = st.sidebar.selectbox("Year", list(years))  # Auswahl des Baujahrs in der Seitenleiste
+    final_row = vehicle_df.iloc[years[selected_year]]  # Direkter Zugriff auf die ausgewählte Zeile über die gespeicherte Position
 
 # Option zum Vergleich mit öffentlichen Verkehrsmitteln
 compare_public_transport = st.sidebar.checkbox("Compare with public transport")  
-if selected_start and selected_end and st.sidebar.button("Calculate Route"):
+show_alternatives = st.sidebar.checkbox("Show alternative vehicles")  # Vergleich mit allen Fahrzeugen im Katalog
+if show_alternatives:
+    alt_fuels = st.sidebar.multiselect("Alternative fuel types", fleet["fuels"])  # Leer = alle Kraftstoffe
+    alt_years = st.sidebar.slider(
+        "Alternative model years",
+        int(fleet["year"].min()), int(fleet["year"].max()),
+        (int(fleet["year"].min()), int(fleet["year"].max()))
+    )  # Baujahrbereich der Alternativen
+# Berechnete Routen bleiben pro Sitzung erhalten: (Start, Ziel) -> (Startkoordinaten, Zielkoordinaten, Route)
+# So muss beim Wechsel des Fahrzeugs oder einer Checkbox nur die Emissionsrechnung neu laufen, nicht die API-Abfrage
+route_memo = st.session_state.setdefault("route_memo", {})
+route_key = (selected_start, selected_end)
+if selected_start and selected_end and (st.sidebar.button("Calculate Route") or route_key in route_memo):
     try:
-        # Berechne Routendaten über OpenRouteService
-        with st.spinner("Calculating route and emissions..."): # Ladeanimation während der Berechnung
-            sc = get_coordinates(selected_start) 
-            ec = get_coordinates(selected_end)
-            route = get_route_info(sc, ec) # Ruft OpenRouteService-Funktion auf, um die Route für die angegebenen Adressen zu berechnen
-        if route is None:   # Wenn keine Route abgerufen werden konnte (API-Fehler), wird eine Fehlermeldung angezeigt und die Ausführung beendet.
-            st.error("❌ Unable to retrieve a route. Please check the addresses and try again.")
-            st.stop()
-        else:
-            distance_km = route["distance_km"]
-            duration_min = route["duration_min"] # min Dauer von OpenRouteService
+        if route_key not in route_memo:
+            # Berechne Routendaten über OpenRouteService
+            with st.spinner("Calculating route and emissions..."): # Ladeanimation während der Berechnung
+                sc, ec, route = resolve_route(selected_start, selected_end) # Geocodiert beide Adressen parallel und berechnet dann die Route über OpenRouteService
+            if route is None:   # Wenn keine Route abgerufen werden konnte (API-Fehler), wird eine Fehlermeldung angezeigt und die Ausführung beendet.
+                st.error("❌ Unable to retrieve a route. Please check the addresses and try again.")
+                st.stop()
+            route_memo[route_key] = (sc, ec, route)
+            while len(route_memo) > ROUTE_MEMO_SIZE:
+                route_memo.pop(next(iter(route_memo)))  # Älteste Route vergessen
+        sc, ec, route = route_memo[route_key]  # Gespeicherte Route dieser Sitzung
+        distance_km = route["distance_km"]
+        duration_min = route["duration_min"] # min Dauer von OpenRouteService
 
         # Hole CO₂- und MPG-(Meilen pro Gallone)-Daten
-        row = final_row.iloc[0] if not car_not_listed else final_row 
+        row = final_row  # In beiden Fällen eine einzelne Zeile (pd.Series)
         co2_g_mile = row["Co2__Tailpipe_For_Fuel_Type1"] # Suche CO₂-Wert für das ausgewählte Auto
         mpg = row.get("Combined_Mpg_For_Fuel_Type1", np.nan) # Hole MPG-Wert, falls verfügbar, sonst NaN
         ghg_score = row.get("GHG_Score", np.nan) # Hole GHG-Score, falls verfügbar, sonst NaN
-        car_emission_kg = (co2_g_mile / 1.60934) * distance_km / 1000 # Berechne Emission in kg: 1 Meile = 1,60934 km und /1000 für kg
+        trip = trip_emissions(co2_g_mile, mpg, distance_km) # Emissionen, Literverbrauch und ÖPNV-Vergleich in einem Schritt
+        car_emission_kg = float(trip["car_kg"]) # Emission in kg
 
         # Geschätzte Auswirkungen
         st.header("Estimated Impact")
@@ -107,11 +129,8 @@ if selected_start and selected_end and st.sidebar.button("Calculate Route"):
         else:
             travel_str = f"{duration_min:.0f}m" # Wenn unter 60 Minuten, in Minuten belassen
 
-        # Berechne Literverbrauch, falls MPG bekannt
-        trip_L = (
-            (235.21 / mpg) * distance_km / 100
-            if pd.notna(mpg) and mpg > 0 else np.nan
-        )
+        # Literverbrauch, falls MPG bekannt (sonst NaN)
+        trip_L = float(trip["fuel_l"])
 
         # Info-Felder
         labels = ["Distance", "Travel Time", "CO₂ Emissions", "Fuel Consumption"]
@@ -180,8 +199,8 @@ if selected_start and selected_end and st.sidebar.button("Calculate Route"):
         # Karte für öffentlichen Verkehr (nur wenn Checkbox aktiviert)
         with g2:
             if compare_public_transport:
-                train_kg = 41 * distance_km / 1000  # 41g CO2/km als Richtwert (Quelle: EEA), /1000 für kg
-                bus_kg = 105 * distance_km / 1000   # 105g CO2/km als Richtwert (Quelle: EEA), /1000 für kg
+                train_kg = float(trip["train_kg"])  # Richtwerte der EEA, siehe emissions.py
+                bus_kg = float(trip["bus_kg"])
                 
                 # Zeige Vergleichskarte für Emissionen an
                 g2.markdown(f"""
@@ -206,14 +225,8 @@ if selected_start and selected_end and st.sidebar.button("Calculate Route"):
             st.markdown("<div style='height:20px'></div>", unsafe_allow_html=True)  # Füge extra Abstand vor der Info-Box über Prozentänderungen hinzu
             
             # Berechne prozentuale Emissionsersparnis, wenn Zug oder Bus statt Auto genommen wird
-            percent_train = (
-                (car_emission_kg - train_kg) / car_emission_kg * 100
-                if car_emission_kg > train_kg else 0
-            )
-            percent_bus = (
-                (car_emission_kg - bus_kg) / car_emission_kg * 100
-                if car_emission_kg > bus_kg else 0
-            )
+            percent_train = float(trip["train_saving_pct"])
+            percent_bus = float(trip["bus_saving_pct"])
             
             # Zeige die berechneten Ersparnisse in einer Info-Box an
             st.info(
@@ -221,7 +234,44 @@ if selected_start and selected_end and st.sidebar.button("Calculate Route"):
                 f"🚌 Taking the bus would reduce emissions by {percent_bus:.1f}%"
             )
 
-        
+
+        # Emissionsverlauf entlang der Route, abhängig vom Tempo auf jedem Abschnitt
+        profile = route_emission_profile(co2_g_mile, route["geometry"], route.get("steps"), duration_min)
+        if len(profile["distance_km"]) > 1 and profile["distance_km"][-1] > 0:
+            st.header("Emissions Along the Route")
+            chart_km = np.linspace(0, profile["distance_km"][-1], PROFILE_CHART_POINTS)  # Gleichmäßig verteilte Stützpunkte statt aller Routenpunkte
+            st.line_chart(
+                pd.DataFrame({
+                    "Distance (km)": chart_km,
+                    "Cumulative CO₂ (kg)": np.interp(chart_km, profile["distance_km"], profile["cum_kg"]),
+                }),
+                x="Distance (km)", y="Cumulative CO₂ (kg)"
+            )
+            st.caption(
+                f"Taking the speed on each stretch into account, this trip emits about {profile['total_kg']:.2f} kg CO₂ "
+                f"(combined-cycle estimate: {car_emission_kg:.2f} kg)."
+            )  # Stadtverkehr und Autobahn verbrauchen mehr als der kombinierte Normwert
+
+        # Vergleich mit dem ganzen Fahrzeugkatalog (nur wenn Checkbox aktiviert)
+        if show_alternatives:
+            st.header("Alternative Vehicles")
+            ranking = rank_fleet(
+                fleet, distance_km, top_k=10,
+                fuels=alt_fuels, year_range=alt_years,
+                reference_g_km=float(g_per_km(co2_g_mile))
+            )  # Alle Fahrzeuge auf einmal bewerten, nur die 10 besten sortieren
+            if ranking["count"]:
+                st.info(
+                    f"Out of {ranking['count']} matching vehicles, {ranking['percentile']:.1f}% "
+                    "emit less CO₂ per km than your car."
+                )
+                alternatives = vehicle_df.iloc[ranking["positions"]][["Make", "Model", "Year", "Fuel_Type1"]].astype(str)  # Nur die wenigen Zeilen der Rangliste
+                alternatives["CO₂ (g/km)"] = ranking["g_km"].round(1)
+                alternatives["Trip CO₂ (kg)"] = ranking["trip_kg"].round(2)
+                st.dataframe(alternatives, hide_index=True)
+            else:
+                st.info("No vehicles match the selected filters.")
+
         # Routenkartenanzeige
         st.header("Route Map")
         display_route_map(route)    # Zeige die Routenkarte mit der berechneten Route an
@@ -232,6 +282,12 @@ if selected_start and selected_end and st.sidebar.button("Calculate Route"):
         st.exception(e)
 
 
+# Diagnose: Laufzeiten, Fehler und Cache-Trefferquoten (nur mit CO2_METRICS=1)
+if metrics.ENABLED:
+    display_diagnostics()
+    if os.environ.get("CO2_METRICS_TEXTFILE"):  # z. B. /var/lib/node_exporter/co2-{pid}.prom für den Textfile-Collector
+        metrics.write_prometheus_textfile(os.environ["CO2_METRICS_TEXTFILE"].format(pid=os.getpid()))
+
 # FUSSZEILE
 st.markdown("---")
 st.caption(
@@ -0,0 +1,108 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize(text: str) -> str:
+    """
+    Normalise text for prefix matching: no accents, case or punctuation.
+
+    Parameters:
+        text (str): Query or label.
+
+    Returns:
+        str: Lowercase words separated by single spaces.
+    """
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))    # "Zürich" -> "Zurich"
+    return " ".join(re.split(r"[\W_]+", text.casefold())).strip()
+
+
+def _matches(query_tokens, label_tokens) -> bool:
+    # Jedes Wort der Eingabe muss Anfang eines Wortes im Label sein
+    return all(any(t.startswith(q) for t in label_tokens) for q in query_tokens)
+
+
+class PrefixIndex:
+    """
+    Remembers autocomplete answers so longer prefixes can be served locally.
+
+    For a query the index looks for the longest earlier query that is a
+    prefix of it and filters that query's labels. The local answer is used
+    when the earlier answer was complete (fewer labels than the API page
+    size), when enough labels still match, or when the earlier remote call
+    happened less than debounce seconds ago and anything matches.
+
+    Parameters:
+        page_size (int): Number of suggestions the API returns per request.
+        min_results (int): Local matches needed to skip the remote call.
+        debounce (float): Seconds after a remote call in which typing further
+            is answered locally whenever there is at least one match.
+        max_queries (int): Number of remembered queries (oldest are dropped).
+    """
+
+    def __init__(self, page_size: int = 10, min_results: int = 3, debounce: float = 1.0, max_queries: int = 5000):
+        self.page_size = page_size
+        self.min_results = min_results
+        self.debounce = debounce
+        self.max_queries = max_queries
+        self.local_hits = 0
+        self.remote_calls = 0
+        self._queries = OrderedDict()    # normalisierte Anfrage -> (Labels, Label-Wörter, Zeitpunkt)
+        self._lock = threading.Lock()
+
+    def add(self, query: str, labels: list):
+        """
+        Remember the labels the API returned for a query.
+
+        Parameters:
+            query (str): The query sent to the API.
+            labels (list): Suggested labels in API order.
+        """
+        entry = (list(labels), [normalize(label).split() for label in labels], time.monotonic())
+        with self._lock:
+            self._queries[normalize(query)] = entry
+            self._queries.move_to_end(normalize(query))
+            while len(self._queries) > self.max_queries:
+                self._queries.popitem(last=False)    # Älteste Anfrage vergessen
+
+    def count_remote_call(self):
+        """Count one autocomplete request that actually went to the API."""
+        with self._lock:
+            self.remote_calls += 1
+
+    def lookup(self, query: str):
+        """
+        Answer a query from earlier results if possible.
+
+        Parameters:
+            query (str): Partial address typed by the user.
+
+        Returns:
+            list or None: Matching labels, or None if the API must be asked.
+        """
+        key = normalize(query)
+        with self._lock:
+            for end in range(len(key), 0, -1):    # Vom längsten zum kürzesten Präfix, wie ein Abstieg im Trie
+                entry = self._queries.get(key[:end])
+                if entry is not None:
+                    self._queries.move_to_end(key[:end])
+                    break
+            else:
+                return None
+        labels, label_tokens, fetched = entry
+        if end == len(key):
+            with self._lock:
+                self.local_hits += 1
+            return list(labels)    # Genau diese Anfrage wurde schon gestellt
+        query_tokens = key.split()
+        found = [label for label, tokens in zip(labels, label_tokens) if _matches(query_tokens, tokens)]
+        complete = len(labels) < self.page_size    # Die API hatte nicht mehr Treffer für das kürzere Präfix
+        recent = time.monotonic() - fetched < self.debounce
+        if complete or len(found) >= self.min_results or (recent and found):
+            with self._lock:
+                self.local_hits += 1
+            return found
+        return None
@@ -0,0 +1,249 @@
+"""
+Headless trip-emissions engine for large CSV or Parquet files.
+
+Each input row is one trip. The start and end are given either as
+addresses (columns 'start', 'end') or as coordinates ('start_lon',
+'start_lat', 'end_lon', 'end_lat'). The vehicle is given either as a
+catalogue key ('make', 'fuel_type', 'model', 'year') or as features for
+the ML model ('fuel_type', 'cylinders', 'year').
+
+Usage:
+    python batch.py trips.csv results.csv --chunksize 10000 --workers 8
+"""
+import argparse
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from emissions import g_per_km, trip_emissions
+
+logger = logging.getLogger(__name__)
+
+RESULT_COLUMNS = [
+    "distance_km", "duration_min", "co2_g_km", "car_kg", "fuel_l",
+    "train_kg", "bus_kg", "train_saving_pct", "bus_saving_pct", "error"
+]
+
+
+def read_trips(path: str, chunksize: int):
+    """
+    Stream trips from a CSV or Parquet file in chunks.
+
+    Parameters:
+        path (str): Input file (.csv or .parquet).
+        chunksize (int): Number of rows per chunk.
+
+    Yields:
+        pd.DataFrame: One chunk of trips.
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq    # Optionale Abhängigkeit, nur für Parquet nötig
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize)
+
+
+class TripWriter:
+    """
+    Append result chunks to a CSV or Parquet file as they are computed.
+
+    Parameters:
+        path (str): Output file (.csv or .parquet).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._parquet = None
+        self._first = True
+
+    def write(self, df: pd.DataFrame):
+        if self.path.endswith(".parquet"):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self._parquet is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                self._parquet = pq.ParquetWriter(self.path, table.schema)
+            else:
+                table = pa.Table.from_pandas(df, schema=self._parquet.schema, preserve_index=False)    # Gleiches Schema wie der erste Block
+            self._parquet.write_table(table)
+        else:
+            df.to_csv(self.path, mode="w" if self._first else "a", header=self._first, index=False)
+        self._first = False
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+def _resolve_routes(chunk: pd.DataFrame, pool: ThreadPoolExecutor):
+    # Koordinaten bestimmen (Adressen werden pro Block nur einmal geocodiert)
+    from Map_API import get_coordinates, get_route_info
+    n = len(chunk)
+    errors = np.full(n, "", dtype=object)
+    if {"start_lon", "start_lat", "end_lon", "end_lat"}.issubset(chunk.columns):
+        missing = chunk[["start_lon", "start_lat", "end_lon", "end_lat"]].isna().any(axis=1).to_numpy()
+        starts = list(zip(chunk["start_lon"].tolist(), chunk["start_lat"].tolist()))
+        ends = list(zip(chunk["end_lon"].tolist(), chunk["end_lat"].tolist()))
+    else:
+        has_start, has_end = chunk["start"].notna().to_numpy(), chunk["end"].notna().to_numpy()
+        missing = ~(has_start & has_end)    # Leere Adressen nicht als "nan" geocodieren
+        addresses = pd.unique(pd.concat([chunk["start"][has_start], chunk["end"][has_end]]).astype(str))
+
+        def geocode(address):
+            try:
+                return tuple(get_coordinates(address))
+            except RuntimeError:
+                return None
+        coords = dict(zip(addresses, pool.map(geocode, addresses)))
+        starts = [coords[a] if ok else None for a, ok in zip(chunk["start"].astype(str), has_start)]
+        ends = [coords[a] if ok else None for a, ok in zip(chunk["end"].astype(str), has_end)]
+    starts = [None if m else s for s, m in zip(starts, missing)]
+    ends = [None if m else e for e, m in zip(ends, missing)]
+
+    # Jede Strecke nur einmal berechnen
+    pairs = list(dict.fromkeys((s, e) for s, e in zip(starts, ends) if s is not None and e is not None))
+
+    def route(pair):
+        try:
+            info = get_route_info(list(pair[0]), list(pair[1]))
+        except Exception as e:    # z. B. Timeout nach allen Wiederholungen: nur diese Strecke fehlt, nicht der ganze Lauf
+            logger.warning("routing failed for %s -> %s: %r", pair[0], pair[1], e)
+            return None
+        return None if info is None else (info["distance_km"], info["duration_min"])
+    routes = dict(zip(pairs, pool.map(route, pairs)))
+
+    distance_km = np.full(n, np.nan)
+    duration_min = np.full(n, np.nan)
+    for i, (s, e) in enumerate(zip(starts, ends)):
+        if missing[i]:
+            errors[i] = "missing start or end"
+        elif s is None or e is None:
+            errors[i] = "geocoding failed"
+        elif routes[(s, e)] is None:
+            errors[i] = "routing failed"
+        else:
+            distance_km[i], duration_min[i] = routes[(s, e)]
+    return distance_km, duration_min, errors
+
+
+def _vehicle_values(chunk: pd.DataFrame, vehicle_df, catalogue_keys, model, le):
+    # CO2 (g/Meile) und MPG pro Zeile: aus dem Katalog oder per ML-Vorhersage
+    from ml_utils import predict_co2_emissions
+    n = len(chunk)
+    co2 = np.full(n, np.nan)
+    mpg = np.full(n, np.nan)
+    catalogue = np.zeros(n, dtype=bool)
+    if {"make", "fuel_type", "model", "year"}.issubset(chunk.columns):
+        # Ein einziger Join gegen die Schlüsseltabelle statt einer Suche pro Zeile
+        lookup = pd.DataFrame({
+            "Make": chunk["make"].astype(str).to_numpy(),
+            "Fuel_Type1": chunk["fuel_type"].astype(str).to_numpy(),
+            "Model": chunk["model"].astype(str).to_numpy(),
+            "Year": pd.to_numeric(chunk["year"], errors="coerce").to_numpy(dtype=float),
+        })
+        keys = catalogue_keys.astype({"Year": float})
+        found = lookup.merge(keys, on=["Make", "Fuel_Type1", "Model", "Year"], how="left")["pos"].to_numpy()    # Schlüssel sind eindeutig: eine Zeile pro Fahrt, gleiche Reihenfolge
+        complete = chunk[["make", "fuel_type", "model", "year"]].notna().all(axis=1).to_numpy()
+        catalogue = complete & ~np.isnan(found)    # Sonst weiter unten mit dem Modell vorhersagen
+        positions = np.where(catalogue, found, -1).astype(np.int64)
+        co2[catalogue] = vehicle_df["Co2__Tailpipe_For_Fuel_Type1"].to_numpy()[positions[catalogue]]
+        mpg[catalogue] = vehicle_df["Combined_Mpg_For_Fuel_Type1"].to_numpy()[positions[catalogue]]
+    if {"fuel_type", "cylinders", "year"}.issubset(chunk.columns):
+        todo = ~catalogue & chunk["cylinders"].notna().to_numpy() & chunk["year"].notna().to_numpy() \
+            & chunk["fuel_type"].astype(str).isin(le.classes_).to_numpy()
+        if todo.any():
+            co2[todo] = predict_co2_emissions(
+                model, le,
+                chunk["fuel_type"].astype(str).to_numpy()[todo],
+                chunk["cylinders"].to_numpy()[todo],
+                chunk["year"].to_numpy()[todo]
+            )    # Ein einziger model.predict-Aufruf pro Block
+    return co2, mpg
+
+
+def process_chunk(chunk: pd.DataFrame, pool: ThreadPoolExecutor, vehicle_df, catalogue_keys, model, le) -> pd.DataFrame:
+    """
+    Compute routes and emissions for one chunk of trips.
+
+    Parameters:
+        chunk (pd.DataFrame): Trips as described in the module docstring.
+        pool (ThreadPoolExecutor): Workers for the geocoding and routing calls.
+        vehicle_df (pd.DataFrame): Cleaned vehicle dataset.
+        catalogue_keys (pd.DataFrame): Key table from utils.vehicle_keys.
+        model: Trained DecisionTreeRegressor.
+        le: LabelEncoder for fuel type.
+
+    Returns:
+        pd.DataFrame: The chunk with the RESULT_COLUMNS appended.
+    """
+    distance_km, duration_min, errors = _resolve_routes(chunk, pool)
+    co2, mpg = _vehicle_values(chunk, vehicle_df, catalogue_keys, model, le)
+    errors[(errors == "") & np.isnan(co2)] = "unknown vehicle"
+    trip = trip_emissions(co2, mpg, distance_km)
+    out = chunk.copy()
+    out["distance_km"] = distance_km
+    out["duration_min"] = duration_min
+    out["co2_g_km"] = g_per_km(co2)
+    for key in ["car_kg", "fuel_l", "train_kg", "bus_kg", "train_saving_pct", "bus_saving_pct"]:
+        out[key] = trip[key]
+    out["error"] = errors
+    return out
+
+
+def run_batch(input_path: str, output_path: str, vehicles_path: str = "all-vehicles-model@public.csv",
+              chunksize: int = 10000, workers: int = 8):
+    """
+    Stream a trips file through routing and emission calculation.
+
+    Only one chunk is held in memory at a time, and results are written as
+    soon as a chunk is done. Throughput is reported per chunk on stderr.
+
+    Parameters:
+        input_path (str): Trips file (.csv or .parquet).
+        output_path (str): Results file (.csv or .parquet).
+        vehicles_path (str): Vehicle CSV used for catalogue lookups and the model.
+        chunksize (int): Number of trips per chunk.
+        workers (int): Maximum number of concurrent API calls.
+
+    Returns:
+        int: Number of trips processed.
+    """
+    from utils import load_vehicle_data, vehicle_keys
+    from ml_utils import train_model
+    vehicle_df = load_vehicle_data(vehicles_path)
+    catalogue_keys = vehicle_keys(vehicle_df)
+    model, le = train_model(vehicle_df)
+
+    writer = TripWriter(output_path)
+    total = 0
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:    # Begrenzte Anzahl gleichzeitiger API-Anfragen
+            for n, chunk in enumerate(read_trips(input_path, chunksize)):
+                t = time.perf_counter()
+                writer.write(process_chunk(chunk, pool, vehicle_df, catalogue_keys, model, le))
+                elapsed = time.perf_counter() - t
+                total += len(chunk)
+                print(
+                    f"chunk {n}: {len(chunk)} trips in {elapsed:.2f}s "
+                    f"({len(chunk) / elapsed:.0f} trips/s, {total} total)",
+                    file=sys.stderr
+                )
+    finally:
+        writer.close()
+    print(f"done: {total} trips in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute car journey CO2 emissions for a file of trips.")
+    parser.add_argument("input", help="trips file (.csv or .parquet)")
+    parser.add_argument("output", help="results file (.csv or .parquet)")
+    parser.add_argument("--vehicles", default="all-vehicles-model@public.csv", help="vehicle CSV")
+    parser.add_argument("--chunksize", type=int, default=10000, help="trips per chunk")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent API calls")
+    args = parser.parse_args()
+    run_batch(args.input, args.output, args.vehicles, args.chunksize, args.workers)
@@ -0,0 +1,85 @@
+import random
+import threading
+import time
+import numpy as np
+from openrouteservice import exceptions
+
+
+class FakeORSClient:
+    """
+    In-process stand-in for openrouteservice.Client.
+
+    Responses have the same shape as the real API and are derived from the
+    request, so repeated calls give identical results. Every call sleeps
+    for `latency` seconds and fails with the given probability.
+
+    Parameters:
+        latency (float): Simulated network latency per call in seconds.
+        failure_rate (float): Probability that a call raises an error.
+        failure_status (int): HTTP status of simulated failures (429 or 5xx
+            are retried by ors_client.RateLimitedClient).
+        route_points (int): Number of vertices in returned route geometries.
+        seed (int): Seed for the failure draws.
+    """
+
+    def __init__(self, latency: float = 0.05, failure_rate: float = 0.0, failure_status: int = 503,
+                 route_points: int = 2000, seed: int = 0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.route_points = route_points
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _request(self):
+        with self._lock:
+            self.calls += 1
+            fail = self._random.random() < self.failure_rate
+        time.sleep(self.latency)
+        if fail:
+            raise exceptions.ApiError(self.failure_status, "simulated failure")
+
+    @staticmethod
+    def _point(text: str):
+        h = sum(ord(c) * (i + 1) for i, c in enumerate(text))    # Deterministische Pseudo-Koordinaten in Mitteleuropa
+        return [6.0 + (h % 4000) / 1000, 46.0 + (h // 4000 % 3000) / 1000]
+
+    def pelias_search(self, text):
+        self._request()
+        return {"features": [{"geometry": {"coordinates": self._point(text)}, "properties": {"label": text}}]}
+
+    def pelias_autocomplete(self, text):
+        self._request()
+        labels = [f"{text}{suffix}, Switzerland" for suffix in ["", "strasse", "weg", "platz", "berg", "dorf", "tal", "bach", "feld", "hof"]]
+        return {"features": [{"properties": {"label": label}} for label in labels]}
+
+    def directions(self, coordinates, profile="driving-car", format="geojson", **kwargs):
+        self._request()
+        (lon0, lat0), (lon1, lat1) = coordinates[0], coordinates[-1]
+        t = np.linspace(0, 1, self.route_points)
+        lon = lon0 + (lon1 - lon0) * t + 0.01 * np.sin(t * 50)    # Leicht kurvige Strecke
+        lat = lat0 + (lat1 - lat0) * t
+        distance = float(np.hypot(lon1 - lon0, lat1 - lat0) * 111000 * 1.3 + 500)
+        steps = max(1, self.route_points // 50)
+        bounds = np.linspace(0, self.route_points - 1, steps + 1).astype(int)
+        return {"features": [{
+            "geometry": {"coordinates": np.column_stack([lon, lat]).tolist()},
+            "properties": {"segments": [{
+                "distance": distance,
+                "duration": distance / 20,    # 72 km/h
+                "steps": [
+                    {"distance": distance / steps, "duration": distance / steps / (12 + 20 * (i % 3)),
+                     "way_points": [int(bounds[i]), int(bounds[i + 1])]}
+                    for i in range(steps)
+                ],
+            }]},
+        }]}
+
+    def distance_matrix(self, locations, profile="driving-car", sources=None, destinations=None, **kwargs):
+        self._request()
+        loc = np.asarray(locations, dtype=float)
+        src = loc[sources if sources is not None else slice(None)]
+        dst = loc[destinations if destinations is not None else slice(None)]
+        dist = np.hypot(src[:, None, 0] - dst[None, :, 0], src[:, None, 1] - dst[None, :, 1]) * 111000 * 1.3
+        return {"distances": dist.tolist(), "durations": (dist / 20).tolist()}
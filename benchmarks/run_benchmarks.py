@@ -0,0 +1,266 @@
+"""
+Benchmark suite for the hot paths of the app.
+
+Uses synthetic vehicle CSVs and an in-process OpenRouteService stand-in,
+so it runs offline and gives reproducible numbers. Results are printed and
+written as JSON.
+
+Usage:
+    python benchmarks/run_benchmarks.py --rows 10000 50000 --latency 0.02 --out benchmark_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+TMP = tempfile.mkdtemp(prefix="co2-bench-")
+os.environ.setdefault("ORS_API_KEY", "benchmark")    # Map_API braucht beim Import einen Schlüssel
+os.environ["ORS_CACHE_PATH"] = os.path.join(TMP, "ors_cache.sqlite3")    # Nie den echten Cache benutzen
+
+import numpy as np
+import pandas as pd
+from fake_ors import FakeORSClient
+from synthetic import write_vehicle_csv
+
+
+def measure(name: str, fn, repeat: int, setup=None, **info) -> dict:
+    """
+    Run fn repeatedly and collect latency, throughput and peak memory.
+
+    Peak memory is the largest Python/NumPy heap growth seen by tracemalloc
+    during one extra, untimed call. Calls that raise are timed like the
+    others and counted in 'errors' and 'error_rate', so simulated API
+    failures show up in the results instead of stopping the suite.
+
+    Parameters:
+        name (str): Benchmark name.
+        fn (callable): Code under test, called without arguments.
+        repeat (int): Number of timed calls.
+        setup (callable, optional): Called before every call, not timed.
+        **info: Extra fields stored with the result (e.g. rows).
+
+    Returns:
+        dict: Result record.
+    """
+    latencies = []
+    errors = 0
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        t = time.perf_counter()
+        try:
+            fn()
+        except Exception:
+            errors += 1    # Fehlgeschlagene Aufrufe gehören zur Messung (z. B. simulierte ORS-Ausfälle)
+        latencies.append(time.perf_counter() - t)
+    # Speicher in einem eigenen Durchlauf messen, weil tracemalloc die Laufzeit verfälscht
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+    except Exception:
+        pass
+    finally:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    lat = np.array(latencies) * 1000
+    result = {
+        "name": name,
+        "calls": repeat,
+        "throughput_per_s": repeat / lat.sum() * 1000 if lat.sum() else float("inf"),
+        "p50_ms": float(np.percentile(lat, 50)),
+        "p99_ms": float(np.percentile(lat, 99)),
+        "peak_mem_mb": peak / 2 ** 20,
+        "errors": errors,
+        "error_rate": errors / repeat if repeat else 0.0,
+        **info,
+    }
+    print(f"{name:<40} p50 {result['p50_ms']:9.3f} ms  p99 {result['p99_ms']:9.3f} ms  "
+          f"{result['throughput_per_s']:10.1f}/s  peak {result['peak_mem_mb']:7.1f} MB  "
+          f"errors {errors}/{repeat}  {info or ''}")
+    return result
+
+
+def bench_vehicle_data(rows: int, repeat: int) -> list:
+    import utils
+    import ml_utils
+    results = []
+    folder = os.path.join(TMP, f"vehicles-{rows}")
+    os.makedirs(folder, exist_ok=True)
+    path = write_vehicle_csv(os.path.join(folder, "vehicles.csv"), rows)
+    store_root = os.path.join(folder, utils.STORE_DIR)
+
+    results.append(measure("load_vehicle_data/csv_parse", lambda: utils.read_vehicle_csv(path), repeat, rows=rows))
+    results.append(measure(
+        "load_vehicle_data/cold_store_build", lambda: utils.open_vehicle_store(utils.build_vehicle_store(path)), repeat,
+        setup=lambda: shutil.rmtree(store_root, ignore_errors=True), rows=rows
+    ))
+    results.append(measure(
+        "load_vehicle_data/warm_store_open", lambda: utils.open_vehicle_store(utils.build_vehicle_store(path)), repeat, rows=rows
+    ))
+    df = utils.open_vehicle_store(utils.build_vehicle_store(path))
+
+    # Fahrzeugauswahl: alte Masken-Kaskade gegen den vorberechneten Index
+    index = utils.build_vehicle_index(df)
+    make = list(index)[0]
+    fuel = list(index[make])[0]
+    model = list(index[make][fuel])[0]
+    year = list(index[make][fuel][model])[0]
+
+    def mask_cascade():
+        df_m = df[df["Make"] == make]
+        sorted(df_m["Fuel_Type1"].unique())
+        df_f = df_m[df_m["Fuel_Type1"] == fuel]
+        sorted(df_f["Model"].unique())
+        df_mod = df_f[df_f["Model"] == model]
+        sorted(df_mod["Year"].unique(), reverse=True)
+        return df[(df["Make"] == make) & (df["Fuel_Type1"] == fuel) & (df["Model"] == model) & (df["Year"] == year)]
+
+    def index_lookup():
+        list(index)
+        list(index[make])
+        list(index[make][fuel])
+        list(index[make][fuel][model])
+        return df.iloc[index[make][fuel][model][year]]
+
+    results.append(measure("vehicle_picker/mask_cascade", mask_cascade, repeat * 10, rows=rows))
+    results.append(measure("vehicle_picker/build_index", lambda: utils.build_vehicle_index(df), repeat, rows=rows))
+    results.append(measure("vehicle_picker/index_lookup", index_lookup, repeat * 10, rows=rows))
+
+    # Modell: Training, gespeichertes Artefakt, Vorhersagen
+    results.append(measure("train_model/fit", lambda: ml_utils.fit_model(df), repeat, rows=rows))
+    artifact = os.path.join(folder, "model.joblib")
+    ml_utils.save_model_artifact(*ml_utils.fit_model(df), artifact)
+    results.append(measure("train_model/load_artifact", lambda: ml_utils.load_model_artifact(artifact), repeat, rows=rows))
+    reg, le = ml_utils.load_model_artifact(artifact)
+    grid = ml_utils.build_prediction_grid(reg, le)
+    fuel_name = le.classes_[0]
+    results.append(measure(
+        "predict_co2_emission/model", lambda: ml_utils.predict_co2_emission(reg, le, fuel_name, 6, 2015), repeat * 10, rows=rows
+    ))
+    results.append(measure(
+        "predict_co2_emission/grid", lambda: ml_utils.predict_co2_emission(reg, le, fuel_name, 6, 2015, grid=grid), repeat * 10, rows=rows
+    ))
+    n = 10000
+    rng = np.random.default_rng(0)
+    fuels, cyl, yrs = rng.choice(le.classes_, n), rng.integers(3, 17, n), rng.integers(1980, 2026, n)
+    results.append(measure(
+        "predict_co2_emissions/batch_10k", lambda: ml_utils.predict_co2_emissions(reg, le, fuels, cyl, yrs), repeat, rows=rows
+    ))
+    return results
+
+
+def bench_route_map(points: int, repeat: int) -> list:
+    import utils
+    t = np.linspace(0, 1, points)
+    coords = np.column_stack([2.3 + 5 * t + 0.01 * np.sin(t * 2000), 48.8 - 2 * t + 0.5 * np.sin(t * 20)])
+
+    def prepare():
+        return utils.prepare_route_path(coords)["path"].tolist()    # Gleiche Vorbereitung wie display_route_map
+
+    from emissions import route_emission_profile
+    bounds = np.linspace(0, points - 1, max(2, points // 50)).astype(int)
+    steps = [[int(a), int(b), 30.0 + 20 * (i % 3)] for i, (a, b) in enumerate(zip(bounds[:-1], bounds[1:]))]
+    return [
+        measure("display_route_map/prepare", prepare, repeat, points=points, kept=len(prepare())),
+        measure("route_emission_profile", lambda: route_emission_profile(250.0, coords, steps, 60.0), repeat, points=points),
+    ]
+
+
+def bench_map_api(latency: float, failure_rate: float, repeat: int) -> list:
+    import Map_API
+    from ors_client import RateLimitedClient, TokenBucket
+    fake = FakeORSClient(latency=latency, failure_rate=failure_rate)
+    Map_API.client = RateLimitedClient(fake, {"default": TokenBucket(1e9, 10 ** 6)}, base_delay=0.001)    # Keine Drosselung im Benchmark
+    results = []
+    counter = iter(range(10 ** 9))
+    info = {"latency_s": latency, "failure_rate": failure_rate}
+
+    def route_or_raise(route):
+        if route is None:
+            raise RuntimeError("no route")    # get_route_info meldet API-Fehler mit None; als Fehler zählen
+        return route
+
+    def cold(fn):
+        return lambda: fn(f"Bahnhofstrasse {next(counter)}, Zurich")    # Neue Adresse: immer ein Cache-Fehltreffer
+
+    results.append(measure("get_coordinates/cold", cold(Map_API.get_coordinates), repeat, **info))
+    results.append(measure("get_coordinates/cached", lambda: Map_API.get_coordinates("Bahnhofstrasse 1, Zurich"), repeat, **info))
+    results.append(measure("autocomplete_address/cold", lambda: Map_API.autocomplete_address(f"Q{next(counter)}x"), repeat, **info))
+    try:
+        Map_API.autocomplete_address("Bahnhof")    # Füllt den Präfix-Index
+    except RuntimeError:
+        pass    # Simulierter Ausfall: die Präfix-Messung fragt dann selbst an
+    results.append(measure("autocomplete_address/prefix_extension", lambda: Map_API.autocomplete_address("Bahnhof Switz"), repeat, **info))
+    pairs = iter([[8.5 + i * 1e-3, 47.3], [7.4, 46.9]] for i in range(10 ** 6))
+    results.append(measure("get_route_info/cold", lambda: route_or_raise(Map_API.get_route_info(*next(pairs))), repeat, **info))
+    results.append(measure("get_route_info/cached", lambda: route_or_raise(Map_API.get_route_info([8.5, 47.3], [7.4, 46.9])), repeat, **info))
+    results.append(measure(
+        "resolve_route/cold",
+        lambda: route_or_raise(Map_API.resolve_route(f"Start {next(counter)}", f"End {next(counter)}")[2]), repeat, **info
+    ))
+    results[-1]["fake_calls_total"] = fake.calls
+    return results
+
+
+def bench_cold_start(repeat: int) -> list:
+    """Import time of the app modules in a fresh interpreter (what a new server process pays)."""
+    results = []
+    for module in ["Map_API", "ml_utils", "utils", "warmup"]:
+        code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+        latencies = []
+        for _ in range(repeat):
+            out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+            latencies.append(float(out.stdout.split()[-1]))
+        lat = np.array(latencies) * 1000
+        result = {"name": f"cold_start/import_{module}", "calls": repeat,
+                  "p50_ms": float(np.percentile(lat, 50)), "p99_ms": float(np.percentile(lat, 99))}
+        print(f"{result['name']:<40} p50 {result['p50_ms']:9.3f} ms  p99 {result['p99_ms']:9.3f} ms")
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CO2 calculator hot paths.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 50000], help="synthetic vehicle CSV sizes")
+    parser.add_argument("--route-points", type=int, nargs="+", default=[1000, 50000], help="route geometry sizes")
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated ORS latency in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of simulated ORS failures")
+    parser.add_argument("--repeat", type=int, default=5, help="timed calls per benchmark")
+    parser.add_argument("--out", default="benchmark_results.json", help="JSON output file")
+    args = parser.parse_args()
+
+    try:
+        results = bench_cold_start(args.repeat)
+        for rows in args.rows:
+            results += bench_vehicle_data(rows, args.repeat)
+        for points in args.route_points:
+            results += bench_route_map(points, args.repeat)
+        results += bench_map_api(args.latency, args.failure_rate, args.repeat * 4)
+    finally:
+        shutil.rmtree(TMP, ignore_errors=True)    # Synthetische CSVs, Fahrzeug-Stores und den SQLite-Cache entfernen
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "args": vars(args),
+            "results": results,
+        }, f, indent=2)
+    print(f"results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+MAKES = ["Audi", "BMW", "Chevrolet", "Ford", "Honda", "Hyundai", "Mercedes-Benz", "Nissan", "Tesla", "Toyota", "Volkswagen", "Volvo"]
+FUELS = ["Regular Gasoline", "Premium Gasoline", "Diesel", "Electricity", "Midgrade Gasoline", "Natural Gas"]
+
+
+def write_vehicle_csv(path: str, rows: int, seed: int = 0) -> str:
+    """
+    Write a synthetic vehicle CSV with the layout of all-vehicles-model@public.csv.
+
+    Column names use the original spelling (spaces, double spaces), so the
+    file goes through the same cleaning as the real dataset. A few unused
+    columns are included to make parsing realistic.
+
+    Parameters:
+        path (str): Output file.
+        rows (int): Number of vehicles.
+        seed (int): Random seed.
+
+    Returns:
+        str: The path written.
+    """
+    rng = np.random.default_rng(seed)
+    fuel = rng.choice(FUELS, rows, p=[0.5, 0.25, 0.1, 0.05, 0.05, 0.05])
+    cylinders = rng.choice([3, 4, 5, 6, 8, 10, 12], rows).astype(float)
+    year = rng.integers(1984, 2026, rows)
+    co2 = np.where(fuel == "Electricity", 0.0, 120 + cylinders * 45 - (year - 1984) * 2 + rng.normal(0, 30, rows))
+    mpg = np.where(fuel == "Electricity", rng.uniform(90, 130, rows), 8880 / np.maximum(co2, 150))
+    cylinders[fuel == "Electricity"] = np.nan
+    df = pd.DataFrame({
+        "Make": rng.choice(MAKES, rows),
+        "Model": [f"Model {i}" for i in rng.integers(0, max(10, rows // 40), rows)],
+        "Year": year,
+        "Fuel Type1": fuel,
+        "Cylinders": cylinders,
+        "Engine Displacement": np.round(cylinders * 0.5, 1),
+        "Co2  Tailpipe For Fuel Type1": np.round(co2, 3),
+        "Combined Mpg For Fuel Type1": np.round(mpg, 1),
+        "GHG Score": rng.choice([-1, 1, 3, 5, 7, 8, 10, np.nan], rows),
+        "Transmission": rng.choice(["Automatic (S6)", "Manual 5-spd", "Automatic (AV)"], rows),
+        "Vehicle Size Class": rng.choice(["Compact Cars", "Midsize Cars", "Small SUV", "Standard Pickup Trucks"], rows),
+    })
+    df.loc[rng.random(rows) < 0.01, "Co2  Tailpipe For Fuel Type1"] = np.nan    # Ein paar unvollständige Zeilen wie im echten Datensatz
+    df.to_csv(path, sep=";", index=False, encoding="utf-8-sig")
+    return path
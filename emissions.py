@@ -0,0 +1,237 @@
+import numpy as np
+from geo import segment_lengths_m
+
+# UMRECHNUNGSFAKTOREN UND RICHTWERTE
+MILE_KM = 1.60934    # 1 Meile = 1,60934 km
+MPG_TO_L_PER_100KM = 235.21    # l/100 km = 235,21 / MPG (US-Gallonen)
+TRAIN_G_PER_KM = 41    # 41 g CO2/km als Richtwert (Quelle: EEA)
+BUS_G_PER_KM = 105    # 105 g CO2/km als Richtwert (Quelle: EEA)
+
+# GESCHWINDIGKEITSABHÄNGIGKEIT
+# Relativer Verbrauch A/v + B + C·v² (v in km/h): fester Aufwand pro Zeit (Leerlauf, Nebenverbraucher),
+# Rollwiderstand und Luftwiderstand; am niedrigsten um 70 km/h
+SPEED_CURVE = (20.0, 0.5, 2.9e-5)
+SPEED_LIMITS_KMH = (5, 150)    # Geschwindigkeiten außerhalb werden begrenzt, damit die Kurve nicht explodiert
+CYCLE_SPEEDS_KMH = (31.5, 77.6)    # Durchschnittstempo der EPA-Zyklen Stadt und Autobahn
+CYCLE_WEIGHTS = (0.55, 0.45)    # Gewichtung im kombinierten Wert der CSV (55 % Stadt, 45 % Autobahn)
+DEFAULT_SPEED_KMH = 50    # Falls eine Route keine Dauer liefert
+
+
+def g_per_km(co2_g_mile):
+    """
+    Convert CO2 emissions from grams per mile to grams per kilometre.
+
+    Parameters:
+        co2_g_mile (float or array-like): Emissions in g/mile.
+
+    Returns:
+        float or np.ndarray: Emissions in g/km.
+    """
+    return np.asarray(co2_g_mile, dtype=float) / MILE_KM
+
+
+def trip_emissions(co2_g_mile, mpg, distance_km) -> dict:
+    """
+    Compute emissions, fuel use and public transport comparisons for trips.
+
+    All inputs may be scalars or arrays of the same length; the result has
+    one value per trip.
+
+    Parameters:
+        co2_g_mile (float or array-like): Car emissions in g/mile.
+        mpg (float or array-like): Combined fuel economy in miles per gallon
+            (NaN or <= 0 if unknown).
+        distance_km (float or array-like): Trip distance in kilometres.
+
+    Returns:
+        dict: Arrays 'car_kg', 'fuel_l', 'train_kg', 'bus_kg',
+              'train_saving_pct' and 'bus_saving_pct'.
+    """
+    co2_g_mile, mpg, distance_km = np.broadcast_arrays(
+        np.asarray(co2_g_mile, dtype=float), np.asarray(mpg, dtype=float), np.asarray(distance_km, dtype=float)
+    )
+    car_kg = g_per_km(co2_g_mile) * distance_km / 1000    # /1000 für kg
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fuel_l = np.where(mpg > 0, MPG_TO_L_PER_100KM / mpg * distance_km / 100, np.nan)    # Liter nur, wenn MPG bekannt
+        train_kg = TRAIN_G_PER_KM * distance_km / 1000
+        bus_kg = BUS_G_PER_KM * distance_km / 1000
+        # Prozentuale Ersparnis, wenn Zug oder Bus statt Auto genommen wird (0, wenn das Auto besser ist)
+        train_saving_pct = np.where(car_kg > train_kg, (car_kg - train_kg) / car_kg * 100, 0.0)
+        bus_saving_pct = np.where(car_kg > bus_kg, (car_kg - bus_kg) / car_kg * 100, 0.0)
+    return {
+        "car_kg": car_kg,
+        "fuel_l": fuel_l,
+        "train_kg": train_kg,
+        "bus_kg": bus_kg,
+        "train_saving_pct": train_saving_pct,
+        "bus_saving_pct": bus_saving_pct,
+    }
+
+
+def build_fleet_table(df) -> dict:
+    """
+    Precompute per-kilometre emission arrays for the whole vehicle catalogue.
+
+    Parameters:
+        df (pd.DataFrame): Cleaned vehicle dataset.
+
+    Returns:
+        dict: Arrays aligned with the rows of df: 'g_km' (CO2 in g/km),
+              'l_100km' (fuel use, NaN if unknown), 'year', and 'make'/'fuel'
+              as integer codes into the lists 'makes'/'fuels'.
+    """
+    make = df["Make"].astype("category").cat
+    fuel = df["Fuel_Type1"].astype("category").cat
+    mpg = np.asarray(df["Combined_Mpg_For_Fuel_Type1"], dtype=float) if "Combined_Mpg_For_Fuel_Type1" in df else np.full(len(df), np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        l_100km = np.where(mpg > 0, MPG_TO_L_PER_100KM / mpg, np.nan)
+    return {
+        "g_km": g_per_km(df["Co2__Tailpipe_For_Fuel_Type1"]),
+        "l_100km": l_100km,
+        "year": np.asarray(df["Year"]),
+        "make": make.codes.to_numpy(),
+        "makes": [str(m) for m in make.categories],
+        "fuel": fuel.codes.to_numpy(),
+        "fuels": [str(f) for f in fuel.categories],
+    }
+
+
+def rank_fleet(fleet: dict, distance_km: float, top_k=10, fuels=None, year_range=None, makes=None,
+               reference_g_km=None) -> dict:
+    """
+    Rank catalogue vehicles by their emissions for one trip.
+
+    Parameters:
+        fleet (dict): Table from build_fleet_table.
+        distance_km (float): Trip distance in kilometres.
+        top_k (int or None): Number of lowest-emission vehicles to return,
+            or None for the full ranking.
+        fuels (list, optional): Only keep these fuel types.
+        year_range (tuple, optional): Inclusive (min, max) model year.
+        makes (list, optional): Only keep these makes.
+        reference_g_km (float, optional): Emissions of the selected car in g/km.
+
+    Returns:
+        dict: 'positions' (catalogue rows, lowest emissions first), 'g_km' and
+              'trip_kg' for those rows, 'count' (vehicles matching the
+              filters) and, with a reference, 'percentile' (share of matching
+              vehicles that emit less than the reference, in %).
+    """
+    g_km = fleet["g_km"]
+    mask = np.isfinite(g_km)
+    if fuels:
+        mask &= np.isin(fleet["fuel"], [fleet["fuels"].index(f) for f in fuels if f in fleet["fuels"]])
+    if makes:
+        mask &= np.isin(fleet["make"], [fleet["makes"].index(m) for m in makes if m in fleet["makes"]])
+    if year_range is not None:
+        mask &= (fleet["year"] >= year_range[0]) & (fleet["year"] <= year_range[1])
+    candidates = np.flatnonzero(mask)
+    values = g_km[candidates]
+
+    if top_k is None or top_k >= len(candidates):
+        order = np.argsort(values, kind="stable")    # Vollständige Rangliste
+    elif top_k <= 0:
+        order = np.array([], dtype=int)
+    else:
+        part = np.argpartition(values, top_k - 1)[:top_k]    # Nur die k besten finden, ohne alles zu sortieren
+        order = part[np.argsort(values[part], kind="stable")]
+    result = {
+        "positions": candidates[order],
+        "g_km": values[order],
+        "trip_kg": values[order] * distance_km / 1000,
+        "count": len(candidates),
+    }
+    if reference_g_km is not None:
+        result["percentile"] = float((values < reference_g_km).mean() * 100) if len(values) else np.nan
+    return result
+
+
+def _raw_speed_factor(speed_kmh):
+    v = np.clip(np.asarray(speed_kmh, dtype=float), *SPEED_LIMITS_KMH)
+    a, b, c = SPEED_CURVE
+    return a / v + b + c * v ** 2
+
+
+def speed_factor(speed_kmh):
+    """
+    Emissions at a given speed relative to the combined-cycle value of the dataset.
+
+    The curve is normalised so that the EPA combined cycle (the basis of
+    the g/mile values in the CSV) averages to 1.
+
+    Parameters:
+        speed_kmh (float or array-like): Driving speed in km/h.
+
+    Returns:
+        float or np.ndarray: Factor to multiply the combined g/km value with.
+    """
+    cycle = np.dot(CYCLE_WEIGHTS, _raw_speed_factor(CYCLE_SPEEDS_KMH))
+    return _raw_speed_factor(speed_kmh) / cycle
+
+
+def segment_speeds_kmh(length_m, steps=None, duration_min=None):
+    """
+    Speed on every segment of a route from the durations of its steps.
+
+    Every segment gets the average speed of the step it belongs to;
+    segments outside any step (or in steps without a usable duration) get
+    the average speed of the whole route.
+
+    Parameters:
+        length_m (np.ndarray): Segment lengths in metres (from segment_lengths_m).
+        steps (list, optional): [first way point, last way point, duration in s]
+            per step, as returned by Map_API.get_route_info.
+        duration_min (float, optional): Duration of the whole route.
+
+    Returns:
+        np.ndarray: Speed per segment in km/h.
+    """
+    total_m = length_m.sum()
+    if duration_min and total_m > 0:
+        mean_kmh = total_m / (duration_min * 60) * 3.6
+    else:
+        mean_kmh = DEFAULT_SPEED_KMH
+    speed = np.full(len(length_m), mean_kmh)
+    if not steps or not len(length_m):
+        return speed
+    steps = np.asarray(steps, dtype=float).reshape(-1, 3)
+    first, last, duration_s = steps[:, 0].astype(int), steps[:, 1].astype(int), steps[:, 2]
+    segment = np.arange(len(length_m))
+    step = np.searchsorted(last, segment, side="right")    # Abschnitt, dessen letzter Wegpunkt nach dem Segment liegt
+    inside = step < len(steps)
+    inside[inside] &= first[step[inside]] <= segment[inside]
+    step_m = np.bincount(step[inside], weights=length_m[inside], minlength=len(steps))    # Länge jedes Abschnitts
+    with np.errstate(divide="ignore", invalid="ignore"):
+        step_kmh = step_m / duration_s * 3.6
+    usable = inside.copy()
+    usable[inside] = np.isfinite(step_kmh[step[inside]]) & (step_kmh[step[inside]] > 0)
+    speed[usable] = step_kmh[step[usable]]
+    return speed
+
+
+def route_emission_profile(co2_g_mile, geometry, steps=None, duration_min=None) -> dict:
+    """
+    Emissions segment by segment along a route, adjusted for the driving speed.
+
+    Parameters:
+        co2_g_mile (float): Combined-cycle emissions of the car in g/mile.
+        geometry (list or np.ndarray): [longitude, latitude] points of the route.
+        steps (list, optional): Route steps from Map_API.get_route_info.
+        duration_min (float, optional): Duration of the whole route.
+
+    Returns:
+        dict: 'distance_km' and 'cum_kg' (cumulative distance and emissions
+              at every point of the geometry), 'speed_kmh' and 'g_km' (per
+              segment) and 'total_kg'.
+    """
+    length_m = segment_lengths_m(geometry)
+    speed_kmh = segment_speeds_kmh(length_m, steps, duration_min)
+    g_km = g_per_km(co2_g_mile) * speed_factor(speed_kmh)
+    segment_kg = g_km * length_m / 1e6    # g/km · m → kg
+    return {
+        "distance_km": np.concatenate([[0.0], np.cumsum(length_m) / 1000]),
+        "cum_kg": np.concatenate([[0.0], np.cumsum(segment_kg)]),
+        "speed_kmh": speed_kmh,
+        "g_km": g_km,
+        "total_kg": float(segment_kg.sum()),
+    }
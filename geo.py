@@ -0,0 +1,32 @@
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8    # Mittlerer Erdradius
+
+
+def haversine_m(lon1, lat1, lon2, lat2):
+    """
+    Great-circle distance between points, vectorised.
+
+    Parameters:
+        lon1, lat1, lon2, lat2 (float or array-like): Coordinates in degrees.
+
+    Returns:
+        float or np.ndarray: Distance in metres.
+    """
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def segment_lengths_m(coords):
+    """
+    Length of every segment of a polyline.
+
+    Parameters:
+        coords (array-like): (n, 2) array of [longitude, latitude] points.
+
+    Returns:
+        np.ndarray: n - 1 segment lengths in metres.
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    return haversine_m(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1])
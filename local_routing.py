@@ -0,0 +1,239 @@
+"""
+Offline car routing over a compact road graph.
+
+The graph is stored as a directory of .npy arrays in CSR layout (like the
+vehicle store) and opened with memory maps:
+
+    node_lon, node_lat        coordinates of every node
+    indptr                    CSR row pointers (one row per node)
+    indices                   target node of every edge
+    length_m, duration_s      cost of every edge
+
+A graph is built from an edge list CSV with the columns u_lon, u_lat,
+v_lon, v_lat, length_m, speed_kmh and optionally oneway (road segments
+exported from an OSM extract, e.g. with osmium or osmnx).
+
+Usage:
+    python local_routing.py edges.csv road_graph/
+"""
+import json
+import os
+import sys
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+from geo import haversine_m
+
+GRAPH_VERSION = 2    # 2: Dauer als float64 und einheitlicher Indextyp, damit SciPy die Memory-Maps direkt nutzt
+DETOUR_FACTOR = 3    # Suchradius als Vielfaches der Luftlinien-Fahrzeit; reicht er nicht, wird ohne Grenze gesucht
+
+
+def build_graph(u_lon, u_lat, v_lon, v_lat, length_m, speed_kmh, oneway=None, precision: int = 6) -> dict:
+    """
+    Build a CSR road graph from road segments.
+
+    Segment end points are merged into nodes when their coordinates agree
+    to `precision` decimal places. Two-way segments get an edge in each
+    direction; of parallel edges between the same nodes only the fastest
+    is kept. Within a row, edges are sorted by target node.
+
+    Parameters:
+        u_lon, u_lat, v_lon, v_lat (array-like): Segment start and end in degrees.
+        length_m (array-like): Segment length in metres.
+        speed_kmh (array-like): Travel speed on the segment.
+        oneway (array-like of bool, optional): True for one-way segments (u -> v only).
+        precision (int): Decimal places used to merge end points.
+
+    Returns:
+        dict: Graph arrays (see module docstring).
+    """
+    u = np.column_stack([u_lon, u_lat]).astype(float)
+    v = np.column_stack([v_lon, v_lat]).astype(float)
+    length_m = np.asarray(length_m, dtype=float)
+    duration_s = length_m / (np.asarray(speed_kmh, dtype=float) / 3.6)
+    oneway = np.zeros(len(u), dtype=bool) if oneway is None else np.asarray(oneway, dtype=bool)
+
+    points = np.round(np.vstack([u, v]), precision)
+    nodes, inverse = np.unique(points, axis=0, return_inverse=True)    # Gleiche Koordinaten = gleicher Knoten
+    inverse = inverse.ravel()
+    src, dst = inverse[:len(u)], inverse[len(u):]
+    two_way = ~oneway
+    src, dst = np.concatenate([src, dst[two_way]]), np.concatenate([dst, src[two_way]])    # Gegenrichtung für zweispurige Straßen
+    length_m = np.concatenate([length_m, length_m[two_way]])
+    duration_s = np.concatenate([duration_s, duration_s[two_way]])
+
+    order = np.lexsort((duration_s, dst, src))    # Kanten nach Startknoten gruppieren (CSR), schnellste zuerst
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (src[order][1:] != src[order][:-1]) | (dst[order][1:] != dst[order][:-1])
+    order = order[first & (src[order] != dst[order])]    # Parallele Kanten und Schleifen entfernen
+    src = src[order]
+    index_dtype = np.int32 if len(order) < 2 ** 31 else np.int64    # Gleicher Typ für indptr und indices, sonst kopiert SciPy beide
+    indptr = np.zeros(len(nodes) + 1, dtype=index_dtype)
+    np.cumsum(np.bincount(src, minlength=len(nodes)), out=indptr[1:])
+    return {
+        "node_lon": nodes[:, 0],
+        "node_lat": nodes[:, 1],
+        "indptr": indptr,
+        "indices": dst[order].astype(index_dtype),
+        "length_m": length_m[order].astype(np.float32),
+        "duration_s": duration_s[order].astype(np.float64),    # Dijkstra rechnet in float64; so ohne Umwandlung bei jeder Suche
+    }
+
+
+def save_graph(graph: dict, path: str):
+    """
+    Write a graph as a directory of .npy files.
+
+    Parameters:
+        graph (dict): Graph arrays from build_graph.
+        path (str): Target directory.
+    """
+    os.makedirs(path, exist_ok=True)
+    for name, values in graph.items():
+        np.save(os.path.join(path, f"{name}.npy"), values)
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"version": GRAPH_VERSION, "nodes": len(graph["node_lon"]), "edges": len(graph["indices"])}, f)
+
+
+def load_graph(path: str) -> dict:
+    """
+    Open a graph written by save_graph with memory maps.
+
+    Parameters:
+        path (str): Graph directory.
+
+    Returns:
+        dict: Graph arrays.
+    """
+    names = ["node_lon", "node_lat", "indptr", "indices", "length_m", "duration_s"]
+    return {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in names}
+
+
+class LocalRouter:
+    """
+    Answers fastest car routes on a road graph.
+
+    Start and end are snapped to the nearest graph node with a KD-tree.
+    Paths come from SciPy's Dijkstra (compiled code). As in A*, the
+    straight-line distance at the fastest speed in the graph gives a lower
+    bound on the travel time; the search only explores nodes within
+    DETOUR_FACTOR times that bound and falls back to an unbounded search
+    if the target lies outside.
+
+    Parameters:
+        graph (dict or str): Graph arrays, or the directory of a saved graph.
+        max_snap_m (float): Give up if a point is farther than this from the road network.
+    """
+
+    def __init__(self, graph, max_snap_m: float = 500):
+        self.graph = load_graph(graph) if isinstance(graph, str) else graph
+        self.max_snap_m = max_snap_m
+        lon = np.asarray(self.graph["node_lon"])
+        lat = np.asarray(self.graph["node_lat"])
+        self._cos_lat = np.cos(np.radians(lat.mean()))
+        self._tree = cKDTree(np.column_stack([lon * self._cos_lat, lat]))    # Ebene Näherung für die Suche nach dem nächsten Knoten
+        with np.errstate(divide="ignore", invalid="ignore"):
+            speeds = self.graph["length_m"] / self.graph["duration_s"]
+        self._max_speed = float(np.nanmax(speeds)) if len(speeds) else 1.0    # m/s, für eine zulässige Untergrenze
+        n = len(lon)
+        indptr = self.graph["indptr"]
+        # Ohne Kopie: die Matrix verweist direkt auf die Memory-Maps (ältere Graphen mit float32 werden einmal umgewandelt)
+        self._times = csr_matrix(
+            (np.asarray(self.graph["duration_s"], dtype=float), self.graph["indices"], indptr), shape=(n, n), copy=False
+        )
+        self._max_degree = int(np.diff(indptr).max()) if n else 0    # Für die Suche der Kante zu einem Knotenpaar
+
+    def snap(self, coords):
+        """
+        Find the graph node nearest to a point.
+
+        Parameters:
+            coords (list): [longitude, latitude].
+
+        Returns:
+            int or None: Node id, or None if it is farther than max_snap_m.
+        """
+        _, node = self._tree.query([coords[0] * self._cos_lat, coords[1]])
+        dist = haversine_m(coords[0], coords[1], self.graph["node_lon"][node], self.graph["node_lat"][node])
+        return int(node) if dist <= self.max_snap_m else None
+
+    def shortest_path(self, source: int, target: int):
+        """
+        Find the fastest path between two nodes.
+
+        Parameters:
+            source (int): Start node.
+            target (int): End node.
+
+        Returns:
+            tuple or None: (node ids, edge ids) along the path, or None if unreachable.
+        """
+        if source == target:
+            return np.array([source]), np.array([], dtype=np.int64)    # Start und Ziel am selben Knoten: Route der Länge 0
+        g = self.graph
+        lower = float(haversine_m(g["node_lon"][source], g["node_lat"][source],
+                                  g["node_lon"][target], g["node_lat"][target])) / self._max_speed
+        for limit in (max(lower * DETOUR_FACTOR, 60.0), np.inf):
+            times, previous = dijkstra(self._times, indices=source, return_predecessors=True, limit=limit)
+            if np.isfinite(times[target]):
+                break
+        else:
+            return None    # Ziel nicht erreichbar
+        nodes = [target]
+        while nodes[-1] != source:
+            nodes.append(int(previous[nodes[-1]]))
+        nodes = np.array(nodes[::-1])
+        return nodes, self._edges_between(nodes[:-1], nodes[1:])
+
+    def _edges_between(self, u, v):
+        # Kante u -> v in der CSR-Zeile von u suchen, für alle Paare auf einmal (Zeilen sind kurz)
+        indptr, indices = self.graph["indptr"], self.graph["indices"]
+        start = np.asarray(indptr[u], dtype=np.int64)
+        degree = np.asarray(indptr[u + 1], dtype=np.int64) - start
+        offsets = np.arange(self._max_degree)
+        candidates = np.minimum(start[:, None] + offsets, len(indices) - 1)
+        hit = (np.asarray(indices[candidates]) == v[:, None]) & (offsets < degree[:, None])
+        return start + hit.argmax(axis=1)
+
+    def route(self, start_coords, end_coords):
+        """
+        Calculate a route like Map_API.get_route_info.
+
+        Parameters:
+            start_coords (list): [longitude, latitude] of the starting point.
+            end_coords (list): [longitude, latitude] of the destination.
+
+        Returns:
+            dict: 'distance_km', 'duration_min', 'geometry' and 'steps' (one
+                  step per edge), or None if a point is off the network or
+                  no path exists.
+        """
+        source, target = self.snap(start_coords), self.snap(end_coords)
+        if source is None or target is None:
+            return None
+        found = self.shortest_path(source, target)
+        if found is None:
+            return None
+        nodes, edges = found
+        g = self.graph
+        duration_s = np.asarray(g["duration_s"])[edges].astype(float)
+        first = np.arange(len(edges))
+        return {
+            "distance_km": float(np.asarray(g["length_m"])[edges].sum()) / 1000,
+            "duration_min": float(duration_s.sum()) / 60,
+            "geometry": np.column_stack([np.asarray(g["node_lon"])[nodes], np.asarray(g["node_lat"])[nodes]]).tolist(),
+            "steps": np.column_stack([first, first + 1, duration_s]).tolist(),    # Jede Kante ist ein Abschnitt
+        }
+
+
+# Build-Schritt: python local_routing.py edges.csv road_graph/
+if __name__ == "__main__":
+    import pandas as pd
+    edges = pd.read_csv(sys.argv[1])
+    graph = build_graph(
+        edges["u_lon"], edges["u_lat"], edges["v_lon"], edges["v_lat"],
+        edges["length_m"], edges["speed_kmh"], edges["oneway"] if "oneway" in edges else None
+    )
+    save_graph(graph, sys.argv[2])
+    print(f"{len(graph['node_lon'])} nodes, {len(graph['indices'])} edges written to {sys.argv[2]}")
@@ -0,0 +1,198 @@
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Messung einschalten mit CO2_METRICS=1; ausgeschaltet kostet jeder Aufruf nur eine if-Abfrage
+ENABLED = os.environ.get("CO2_METRICS", "").lower() in ("1", "true", "yes", "on")
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))    # Grenzen der Histogramme in Sekunden
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))    # Werte als Text, damit z. B. 429 und "Timeout" sortierbar bleiben
+
+
+class Registry:
+    """
+    In-process store for counters, latency histograms and gauges.
+
+    Metrics are identified by a name and a set of labels, as in Prometheus.
+    Gauges are callbacks evaluated when the metrics are read.
+    """
+
+    def __init__(self):
+        self.counters = {}    # (Name, Labels) -> Wert
+        self.histograms = {}    # (Name, Labels) -> [Zähler pro Bucket, Summe, Anzahl]
+        self.gauges = {}    # Name -> Funktion, die {Labels: Wert} liefert
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Add value to a counter."""
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        """Record one duration in a histogram."""
+        key = _key(name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    hist[0][i] += 1
+                    break
+            hist[1] += seconds
+            hist[2] += 1
+
+    def register_gauge(self, name: str, fn):
+        """
+        Register a gauge.
+
+        Parameters:
+            name (str): Metric name.
+            fn (callable): Returns a dict {labels (dict as tuple of items): value}
+                or a single number.
+        """
+        self.gauges[name] = fn
+
+    def _gauge_values(self):
+        for name, fn in self.gauges.items():
+            try:
+                values = fn()
+            except Exception:
+                continue    # Eine fehlerhafte Messung darf den Export nicht verhindern
+            if not isinstance(values, dict):
+                values = {(): values}
+            for labels, value in values.items():
+                yield name, labels, value
+
+    def snapshot(self) -> dict:
+        """
+        Return all metrics as plain Python data.
+
+        Returns:
+            dict: 'counters', 'histograms' (count, sum, mean and bucket
+                  counts) and 'gauges', each a list of records.
+        """
+        with self._lock:
+            counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in self.counters.items()]
+            histograms = [
+                {"name": n, "labels": dict(l), "count": h[2], "sum": h[1], "mean": h[1] / h[2] if h[2] else 0.0,
+                 "buckets": dict(zip(BUCKETS, h[0]))}
+                for (n, l), h in self.histograms.items()
+            ]
+        gauges = [{"name": n, "labels": dict(l), "value": v} for n, l, v in self._gauge_values()]
+        return {"counters": counters, "histograms": histograms, "gauges": gauges}
+
+    def export_prometheus(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: Metrics text.
+        """
+        def fmt(labels):
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{k}="{str(v)}"' for k, v in labels) + "}"
+
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((k, (list(h[0]), h[1], h[2])) for k, h in self.histograms.items())
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                lines.append(f"# TYPE {name} counter")
+                seen.add(name)
+            lines.append(f"{name}{fmt(labels)} {value}")
+        for (name, labels), (buckets, total, count) in histograms:
+            if name not in seen:
+                lines.append(f"# TYPE {name} histogram")
+                seen.add(name)
+            cumulative = 0
+            for bound, n in zip(BUCKETS, buckets):
+                cumulative += n    # Prometheus erwartet kumulative Buckets
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{fmt(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{fmt(labels)} {total}")
+            lines.append(f"{name}_count{fmt(labels)} {count}")
+        for name, labels, value in self._gauge_values():
+            if name not in seen:
+                lines.append(f"# TYPE {name} gauge")
+                seen.add(name)
+            lines.append(f"{name}{fmt(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Forget all counters and histograms (gauges stay registered)."""
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+registry = Registry()
+
+
+def enable(flag: bool = True):
+    """Switch metric collection on or off at runtime."""
+    global ENABLED
+    ENABLED = flag
+
+
+@contextmanager
+def span(name: str):
+    """
+    Time a block of code as function `name`.
+
+    Records the duration in co2_function_duration_seconds and counts
+    exceptions in co2_function_errors_total.
+
+    Parameters:
+        name (str): Span name, e.g. 'utils.load_vehicle_data'.
+    """
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        registry.inc("co2_function_errors_total", function=name)
+        raise
+    finally:
+        registry.observe("co2_function_duration_seconds", time.perf_counter() - start, function=name)
+
+
+def timed(name: str):
+    """
+    Decorator that times every call of a function like span().
+
+    Parameters:
+        name (str): Span name, e.g. 'utils.load_vehicle_data'.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)    # Ausgeschaltet: direkt aufrufen
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def write_prometheus_textfile(path: str):
+    """
+    Write the Prometheus export to a file, e.g. for node_exporter's textfile collector.
+
+    Parameters:
+        path (str): Target file (replaced atomically).
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(registry.export_prometheus())
+    os.replace(tmp, path)
@@ -1,13 +1,26 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
 import streamlit as st
 import pandas as pd
-from sklearn.tree import DecisionTreeRegressor
-from sklearn.preprocessing import LabelEncoder
+import numpy as np
+from importlib.metadata import version
+from metrics import timed
+# scikit-learn und joblib werden erst bei Bedarf importiert, weil allein der Import über eine Sekunde dauert
 
-# Das speichert das Machine-Learning-Modell im Cache, damit es nicht jedes Mal neu trainiert wird
-@st.cache_resource
-def train_model(df: pd.DataFrame):  # Wandle Kraftstoffart (ein Wort) in Zahlen um, die das Modell versteht
+FEATURES = ["Fuel_Type1_Encoded", "Cylinders", "Year"]    # Eingabemerkmale des Modells, in dieser Reihenfolge
+CYLINDER_RANGE = (3, 16)    # Gleiche Grenzen wie die Eingabefelder in der Seitenleiste
+YEAR_RANGE = (1980, 2025)
+TARGET = "Co2__Tailpipe_For_Fuel_Type1"    # Zielgröße (g CO2 pro Meile)
+MODEL_PARAMS = {"random_state": 42}    # Parameter des Entscheidungsbaums; fließen in den Artefakt-Hash ein
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".model_store")    # Ordner für gespeicherte Modelle
+
+@timed("ml_utils.fit_model")
+def fit_model(df: pd.DataFrame):
     """
-    Train a Decision Tree Regressor on vehicle data to predict CO2 emissions.
+    Fit a Decision Tree Regressor on vehicle data to predict CO2 emissions.
 
     Parameters:
         df (pd.DataFrame): Cleaned vehicle dataset.
@@ -16,20 +29,131 @@ def train_model(df: pd.DataFrame):  # Wandle Kraftstoffart (ein Wort) in Zahlen
         model (DecisionTreeRegressor): Trained decision tree model.
         le (LabelEncoder): Label encoder for fuel type.
     """
+    from sklearn.tree import DecisionTreeRegressor
+    from sklearn.preprocessing import LabelEncoder
     # Entferne Zeilen, bei denen wichtige Daten fehlen
     data = df.dropna(
-        subset=["Fuel_Type1", "Cylinders", "Year", "Co2__Tailpipe_For_Fuel_Type1"]   
+        subset=["Fuel_Type1", "Cylinders", "Year", TARGET]   
     ).copy()
     # Wandle Kraftstoffart (ein Wort) in Zahlen um, die das Modell versteht
     le = LabelEncoder()
-    data["Fuel_Type1_Encoded"] = le.fit_transform(data["Fuel_Type1"])
-    X = data[["Fuel_Type1_Encoded", "Cylinders", "Year"]]     # Setze die Eingabemerkmale (Kraftstoff, Zylinderanzahl, Baujahr)
-    y = data["Co2__Tailpipe_For_Fuel_Type1"]    # Setze das Ziel, das wir vorhersagen wollen (CO2-Ausstoß)
-    model = DecisionTreeRegressor(random_state=42)     # Erstelle das Decision-Tree-Modell
+    data["Fuel_Type1_Encoded"] = le.fit_transform(data["Fuel_Type1"].astype(str))
+    X = data[FEATURES]     # Setze die Eingabemerkmale (Kraftstoff, Zylinderanzahl, Baujahr)
+    y = data[TARGET]    # Setze das Ziel, das wir vorhersagen wollen (CO2-Ausstoß)
+    model = DecisionTreeRegressor(**MODEL_PARAMS)     # Erstelle das Decision-Tree-Modell
     model.fit(X, y)    # Trainiere das Modell mit unseren Daten
     return model, le    # Gib das trainierte Modell und den Encoder zurück
 
-def predict_co2_emission(model, le, fuel_type, cylinders, year) -> float:
+@timed("ml_utils.training_hash")
+def training_hash(df: pd.DataFrame) -> str:
+    """
+    Compute the key of the model artifact for a training dataset.
+
+    The key covers the training columns, the feature list, the model
+    parameters and the scikit-learn version, so any change forces a refit.
+
+    Parameters:
+        df (pd.DataFrame): Cleaned vehicle dataset.
+
+    Returns:
+        str: Hex digest identifying the artifact.
+    """
+    data = df[["Fuel_Type1", "Cylinders", "Year", TARGET]]
+    digest = hashlib.sha256(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())    # Inhalts-Hash der Trainingsdaten
+    digest.update(json.dumps({
+        "features": FEATURES,
+        "target": TARGET,
+        "params": MODEL_PARAMS,
+        "sklearn": version("scikit-learn"),    # Ohne scikit-learn zu importieren
+    }, sort_keys=True).encode())
+    return digest.hexdigest()
+
+def artifact_path(key: str, model_dir: str = MODEL_DIR) -> str:
+    return os.path.join(model_dir, f"co2_model-{key[:16]}.joblib")
+
+@timed("ml_utils.save_model_artifact")
+def save_model_artifact(model, le, path: str):
+    """
+    Write a fitted model and its encoder to disk atomically.
+
+    Parameters:
+        model: Trained DecisionTreeRegressor.
+        le: LabelEncoder for fuel type.
+        path (str): Target file.
+    """
+    import joblib
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".build-", dir=os.path.dirname(path))    # Erst temporär schreiben, damit andere Prozesse nie eine halbe Datei lesen
+    try:
+        with os.fdopen(fd, "wb") as f:
+            joblib.dump({"model": model, "le": le}, f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+@timed("ml_utils.load_model_artifact")
+def load_model_artifact(path: str):
+    """
+    Read a model artifact written by save_model_artifact.
+
+    Parameters:
+        path (str): Artifact file.
+
+    Returns:
+        model (DecisionTreeRegressor): Trained decision tree model.
+        le (LabelEncoder): Label encoder for fuel type.
+    """
+    import joblib
+    artifact = joblib.load(path)
+    return artifact["model"], artifact["le"]
+
+@timed("ml_utils.build_model_artifact")
+def build_model_artifact(df: pd.DataFrame, model_dir: str = MODEL_DIR) -> str:
+    """
+    Fit and store the model for a dataset unless a matching artifact exists.
+
+    Parameters:
+        df (pd.DataFrame): Cleaned vehicle dataset.
+        model_dir (str): Folder holding the artifacts.
+
+    Returns:
+        str: Path of the artifact.
+    """
+    path = artifact_path(training_hash(df), model_dir)
+    if not os.path.exists(path):
+        model, le = fit_model(df)
+        save_model_artifact(model, le, path)
+    return path
+
+# Das speichert das Machine-Learning-Modell im Cache, damit es nicht jedes Mal neu geladen wird
+@st.cache_resource
+@timed("ml_utils.train_model")
+def train_model(df: pd.DataFrame):
+    """
+    Load the CO2 model for a dataset, fitting it only if no artifact matches.
+
+    Parameters:
+        df (pd.DataFrame): Cleaned vehicle dataset.
+
+    Returns:
+        model (DecisionTreeRegressor): Trained decision tree model.
+        le (LabelEncoder): Label encoder for fuel type.
+    """
+    path = artifact_path(training_hash(df))
+    try:
+        return load_model_artifact(path)    # Gespeichertes Modell passt zu den Daten
+    except Exception:
+        pass    # Kein (lesbares) Artefakt: neu trainieren
+    model, le = fit_model(df)
+    try:
+        save_model_artifact(model, le, path)
+    except OSError:
+        pass    # Ohne Schreibzugriff wird nur im Speicher gehalten
+    return model, le
+
+@timed("ml_utils.predict_co2_emission")
+def predict_co2_emission(model, le, fuel_type, cylinders, year, grid=None) -> float:
     """
     Predict CO2 emissions based on user input using the trained model.
 
@@ -39,16 +163,113 @@ def predict_co2_emission(model, le, fuel_type, cylinders, year) -> float:
         fuel_type (str): Type of fuel.
         cylinders (int): Number of engine cylinders.
         year (int): Vehicle model year.
+        grid (dict, optional): Lookup table from build_prediction_grid. When
+            the input lies inside it, no model call is made.
 
     Returns:
         float: Predicted CO2 emission value.
     """
-    # Erstelle ein kleines DataFrame (1 Zeile) mit den Autodaten des Nutzers
-    inp = pd.DataFrame(
-        [[fuel_type, cylinders, year]],
-        columns=["Fuel_Type1", "Cylinders", "Year"]
-    )
-    # Verschlüssele die Kraftstoffart, damit das Modell sie versteht
-    inp["Fuel_Type1_Encoded"] = le.transform(inp["Fuel_Type1"])
-     # Frage das Modell, den CO2-Ausstoß für dieses Auto vorherzusagen
-    return model.predict(inp[["Fuel_Type1_Encoded", "Cylinders", "Year"]])[0] 
\ No newline at end of file
+    if grid is not None:
+        value = lookup_co2_emission(grid, fuel_type, cylinders, year)
+        if value is not None:
+            return value    # Treffer in der vorberechneten Tabelle
+    return float(predict_co2_emissions(model, le, [fuel_type], [cylinders], [year])[0])
+
+@timed("ml_utils.predict_co2_emissions")
+def predict_co2_emissions(model, le, fuel_types, cylinders, years) -> np.ndarray:
+    """
+    Predict CO2 emissions for many vehicles with a single model call.
+
+    Parameters:
+        model: Trained DecisionTreeRegressor.
+        le: LabelEncoder for encoding fuel types.
+        fuel_types (array-like of str): Fuel type per vehicle.
+        cylinders (array-like of int): Number of engine cylinders per vehicle.
+        years (array-like of int): Model year per vehicle.
+
+    Returns:
+        np.ndarray: Predicted CO2 emission value per vehicle.
+    """
+    fuel_types, cylinders, years = np.broadcast_arrays(
+        np.asarray(fuel_types, dtype=object), np.asarray(cylinders), np.asarray(years)
+    )    # Erlaubt auch einen einzelnen Kraftstoff für viele Zeilen
+    uniques, inverse = np.unique(fuel_types.ravel(), return_inverse=True)
+    encoded = le.transform(uniques)[inverse]    # Nur die wenigen verschiedenen Kraftstoffe verschlüsseln
+    X = pd.DataFrame({
+        "Fuel_Type1_Encoded": encoded,
+        "Cylinders": cylinders.ravel(),
+        "Year": years.ravel(),
+    }, columns=FEATURES)
+    return model.predict(X).reshape(fuel_types.shape)
+
+@timed("ml_utils.build_prediction_grid")
+def build_prediction_grid(model, le, cylinder_range=CYLINDER_RANGE, year_range=YEAR_RANGE) -> dict:
+    """
+    Precompute predictions for every fuel type, cylinder count and year.
+
+    Parameters:
+        model: Trained DecisionTreeRegressor.
+        le: LabelEncoder for encoding fuel types.
+        cylinder_range (tuple): Inclusive (min, max) number of cylinders.
+        year_range (tuple): Inclusive (min, max) model year.
+
+    Returns:
+        dict: Lookup table with keys 'fuels' (fuel type -> row), 'cylinder_min',
+              'year_min' and 'table' (array indexed [fuel, cylinders, year]).
+    """
+    fuels = list(le.classes_)
+    cyl = np.arange(cylinder_range[0], cylinder_range[1] + 1)
+    yrs = np.arange(year_range[0], year_range[1] + 1)
+    F, C, Y = np.meshgrid(np.array(fuels, dtype=object), cyl, yrs, indexing="ij")    # Alle Kombinationen auf einmal
+    table = predict_co2_emissions(model, le, F, C, Y)
+    return {
+        "fuels": {fuel: i for i, fuel in enumerate(fuels)},
+        "cylinder_min": int(cyl[0]),
+        "year_min": int(yrs[0]),
+        "table": table,
+    }
+
+@timed("ml_utils.lookup_co2_emission")
+def lookup_co2_emission(grid: dict, fuel_type, cylinders, year):
+    """
+    Read a prediction from a table built by build_prediction_grid.
+
+    Parameters:
+        grid (dict): Lookup table.
+        fuel_type (str): Type of fuel.
+        cylinders (int): Number of engine cylinders.
+        year (int): Vehicle model year.
+
+    Returns:
+        float or None: Predicted CO2 emission value, or None if the input
+        lies outside the table.
+    """
+    i = grid["fuels"].get(fuel_type)
+    c = int(cylinders) - grid["cylinder_min"]
+    y = int(year) - grid["year_min"]
+    table = grid["table"]
+    if i is None or cylinders != int(cylinders) or not (0 <= c < table.shape[1] and 0 <= y < table.shape[2]):
+        return None    # Außerhalb der Tabelle (oder Kommazahl): das Modell muss gefragt werden
+    return float(table[i, c, y])
+
+# Die Tabelle einmal pro Modell aufbauen; _model und _le werden nicht gehasht, model_key unterscheidet die Modelle
+@st.cache_resource
+@timed("ml_utils.load_prediction_grid")
+def load_prediction_grid(_model, _le, model_key) -> dict:
+    """
+    Build and cache the prediction lookup table for a trained model.
+
+    Parameters:
+        _model: Trained DecisionTreeRegressor.
+        _le: LabelEncoder for encoding fuel types.
+        model_key: Any hashable value that changes whenever the model changes.
+
+    Returns:
+        dict: Lookup table as returned by build_prediction_grid.
+    """
+    return build_prediction_grid(_model, _le)
+
+# Build-Schritt: python ml_utils.py all-vehicles-model@public.csv
+if __name__ == "__main__":
+    from utils import load_vehicle_data
+    print(build_model_artifact(load_vehicle_data(sys.argv[1] if len(sys.argv) > 1 else "all-vehicles-model@public.csv")))
@@ -0,0 +1,163 @@
+import random
+import threading
+import time
+import warnings
+import metrics
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}    # Vorübergehende Fehler, die einen neuen Versuch lohnen
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that limits the request rate of one process.
+
+    Parameters:
+        rate_per_minute (float): Sustained number of requests per minute.
+        burst (int): Number of requests allowed back to back.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60    # Token pro Sekunde
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)    # Außerhalb der Sperre warten, damit andere Threads nicht blockieren
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Decide whether a failed request should be retried.
+
+    Parameters:
+        error (Exception): Error raised by the OpenRouteService client.
+
+    Returns:
+        bool: True for rate limiting, server errors, timeouts and connection problems.
+    """
+    import requests
+    from openrouteservice import exceptions
+    if isinstance(error, exceptions.ApiError):
+        return error.status in RETRY_STATUSES
+    if isinstance(error, exceptions.HTTPError):
+        return error.status_code in RETRY_STATUSES
+    return isinstance(error, (exceptions.Timeout, requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+class RateLimitedClient:
+    """
+    Wraps an OpenRouteService client with rate limiting and retries.
+
+    Every method call waits for a token from the bucket for that method
+    (or the 'default' bucket). Transient errors are retried up to `retries`
+    times with full-jitter exponential backoff, as long as the call stays
+    within `max_elapsed` seconds; other errors are raised unchanged. This
+    is the only retry layer: make_client switches off the retries of the
+    openrouteservice library.
+
+    Parameters:
+        client: The OpenRouteService client (or a stand-in with the same methods).
+        buckets (dict): Method name -> TokenBucket; must contain 'default'.
+        retries (int): Maximum number of retries per call.
+        base_delay (float): Backoff base in seconds.
+        max_delay (float): Upper bound of a single backoff in seconds.
+        max_elapsed (float): No retry is started after this many seconds;
+            a call takes at most this plus one request timeout.
+    """
+
+    def __init__(self, client, buckets: dict, retries: int = 4, base_delay: float = 0.5, max_delay: float = 8.0,
+                 max_elapsed: float = 30.0):
+        self.client = client
+        self.buckets = buckets
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_elapsed = max_elapsed
+
+    def call(self, name: str, **kwargs):
+        """
+        Call a client method with rate limiting and retries.
+
+        Parameters:
+            name (str): Method name, e.g. 'directions'.
+            **kwargs: Arguments of the method.
+
+        Returns:
+            The method's response.
+        """
+        method = getattr(self.client, name)
+        bucket = self.buckets.get(name, self.buckets["default"])    # ORS hat pro Endpunkt eigene Kontingente
+        deadline = time.monotonic() + self.max_elapsed
+        for attempt in range(self.retries + 1):
+            bucket.acquire()
+            start = time.perf_counter()
+            try:
+                return method(**kwargs)
+            except Exception as e:
+                if metrics.ENABLED:
+                    metrics.registry.inc("co2_ors_errors_total", endpoint=name, error=getattr(e, "status", type(e).__name__))
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))    # Zufällige Wartezeit verhindert, dass alle Threads gleichzeitig erneut anfragen
+                if attempt == self.retries or not is_transient(e) or time.monotonic() + delay > deadline:
+                    raise    # Keine Versuche mehr oder Zeitbudget des Aufrufs aufgebraucht
+                if metrics.ENABLED:
+                    metrics.registry.inc("co2_ors_retries_total", endpoint=name)
+            finally:
+                if metrics.ENABLED:
+                    metrics.registry.observe("co2_ors_request_duration_seconds", time.perf_counter() - start, endpoint=name)    # Latenz jedes einzelnen Versuchs
+            time.sleep(delay)
+
+    def __getattr__(self, name):
+        # client.directions(...) usw. funktionieren wie beim normalen Client
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return lambda **kwargs: self.call(name, **kwargs)
+
+
+def make_client(key: str, pool_size: int = 16, timeout: float = 20):
+    """
+    Create an OpenRouteService client that reuses keep-alive connections.
+
+    The client's own retries (HTTP 429, and HTTP 503 for up to a minute)
+    are switched off, because RateLimitedClient handles retries. A 503
+    is raised as ApiError(503) after a single attempt.
+
+    Parameters:
+        key (str): OpenRouteService API key.
+        pool_size (int): Number of pooled connections (should be at least
+            the number of concurrent threads).
+        timeout (float): Request timeout in seconds.
+
+    Returns:
+        openrouteservice.Client: Configured client.
+    """
+    import openrouteservice    # openrouteservice und requests erst beim ersten Client laden
+    import requests
+    from openrouteservice import exceptions
+
+    class SingleAttemptClient(openrouteservice.Client):
+        # Die Bibliothek ruft request() bei HTTP 503 rekursiv mit retry_counter + 1 auf (bis retry_timeout);
+        # diese Wiederholungen umgehen den Token-Bucket, deshalb hier abbrechen
+        def request(self, url, get_params=None, first_request_time=None, retry_counter=0, requests_kwargs=None,
+                    post_json=None, dry_run=None):
+            if retry_counter > 0:
+                raise exceptions.ApiError(503, "Service unavailable")    # Nur 503 wird bei retry_over_query_limit=False wiederholt
+            return super().request(url, get_params, first_request_time, retry_counter, requests_kwargs, post_json, dry_run)
+
+    warnings.filterwarnings("ignore", message="Server down", category=UserWarning, module="openrouteservice")    # "Retrying ..." stimmt nicht mehr
+    client = SingleAttemptClient(key=key, timeout=timeout, retry_over_query_limit=False)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    client._session.mount("https://", adapter)    # Mehr gleichzeitige Keep-Alive-Verbindungen als der Standard (10)
+    client._session.mount("http://", adapter)
+    return client
@@ -0,0 +1,59 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_routing import LocalRouter, build_graph
+
+A, B, C = [8.000, 47.000], [8.001, 47.000], [8.002, 47.000]
+
+
+@pytest.fixture
+def router():
+    # A -> B Einbahnstraße, B - C doppelt (langsam und schnell), C - A langsamer Umweg
+    segments = [
+        (A, B, 100, 50, True),
+        (B, C, 100, 30, False),
+        (B, C, 100, 90, False),
+        (C, A, 300, 10, False),
+    ]
+    u, v, length, speed, oneway = zip(*segments)
+    u, v = np.array(u), np.array(v)
+    graph = build_graph(u[:, 0], u[:, 1], v[:, 0], v[:, 1], length, speed, oneway)
+    return LocalRouter(graph, max_snap_m=50)
+
+
+def test_same_node_is_a_zero_length_route(router):
+    route = router.route(A, [A[0] + 1e-5, A[1]])
+    assert route["distance_km"] == 0
+    assert route["duration_min"] == 0
+    assert len(route["geometry"]) == 1
+    assert route["steps"] == []
+
+
+def test_one_way_is_respected(router):
+    a, b, c = router.snap(A), router.snap(B), router.snap(C)
+    nodes, _ = router.shortest_path(a, b)
+    assert nodes.tolist() == [a, b]
+    nodes, edges = router.shortest_path(b, a)    # Gegen die Einbahnstraße nur über C
+    assert nodes.tolist() == [b, c, a]
+    assert len(edges) == 2
+
+
+def test_fastest_parallel_edge_is_kept(router):
+    b, c = router.snap(B), router.snap(C)
+    g = router.graph
+    row = slice(g["indptr"][b], g["indptr"][b + 1])
+    to_c = g["indices"][row] == c
+    assert to_c.sum() == 1
+    assert g["duration_s"][row][to_c][0] == pytest.approx(100 / (90 / 3.6))
+    route = router.route(B, C)
+    assert route["duration_min"] * 60 == pytest.approx(100 / (90 / 3.6))
+
+
+def test_point_off_the_network_returns_none(router):
+    assert router.snap([9.0, 48.0]) is None
+    assert router.route(A, [9.0, 48.0]) is None
@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Registry
+
+
+def test_mixed_label_types_can_be_exported():
+    # Fehlercodes (int) und Ausnahmenamen (str) unter demselben Label
+    registry = Registry()
+    registry.inc("co2_ors_errors_total", endpoint="directions", error=429)
+    registry.inc("co2_ors_errors_total", endpoint="directions", error="Timeout")
+    registry.observe("co2_ors_request_duration_seconds", 0.1, endpoint="directions", status=200)
+    registry.observe("co2_ors_request_duration_seconds", 0.2, endpoint="directions", status="Timeout")
+
+    text = registry.export_prometheus()
+    assert 'co2_ors_errors_total{endpoint="directions",error="429"} 1' in text
+    assert 'co2_ors_errors_total{endpoint="directions",error="Timeout"} 1' in text
+    assert len(registry.snapshot()["histograms"]) == 2
+
+
+def test_int_and_str_label_values_share_a_series():
+    registry = Registry()
+    registry.inc("co2_route_failures_total", status=429)
+    registry.inc("co2_route_failures_total", status="429")
+    assert registry.snapshot()["counters"] == [
+        {"name": "co2_route_failures_total", "labels": {"status": "429"}, "value": 2}
+    ]
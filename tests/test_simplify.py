@@ -0,0 +1,46 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import simplify_line
+
+
+def _route(n=2000):
+    t = np.linspace(0, 1, n)
+    return np.column_stack([8.0 + 0.5 * t + 0.002 * np.sin(t * 300), 47.0 + 0.2 * np.sin(t * 12)])
+
+
+def _distance_to_polyline(points, line):
+    # Abstand jedes Punkts zum nächsten Segment, in der Ebene von simplify_line (Länge mal cos der mittleren Breite)
+    scale = np.array([np.cos(np.radians(points[:, 1].mean())), 1.0])
+    p, a, b = points * scale, line[:-1] * scale, line[1:] * scale
+    ab = b - a
+    t = np.clip(np.einsum("pij,ij->pi", p[:, None] - a, ab) / np.maximum((ab ** 2).sum(axis=1), 1e-30), 0, 1)
+    closest = a + t[..., None] * ab
+    return np.sqrt(((p[:, None] - closest) ** 2).sum(axis=2)).min(axis=1)
+
+
+def test_dropped_points_are_within_tolerance():
+    coords = _route()
+    tolerance = 1e-4
+    result = simplify_line(coords, tolerance)
+    assert 2 < len(result) < len(coords)
+    assert _distance_to_polyline(coords, result).max() <= tolerance * (1 + 1e-9)
+
+
+def test_point_budget_keeps_start_and_end():
+    coords = _route()
+    for max_points in (2, 3, 50):
+        result = simplify_line(coords, 0.0, max_points)
+        assert len(result) <= max_points
+        np.testing.assert_array_equal(result[0], coords[0])
+        np.testing.assert_array_equal(result[-1], coords[-1])
+
+
+def test_budget_below_two_is_rejected():
+    with pytest.raises(ValueError):
+        simplify_line(_route(), 1e-4, max_points=1)
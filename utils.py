@@ -1,62 +1,404 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
 import streamlit as st
 import pandas as pd
-import pydeck as pdk
+import numpy as np
+from emissions import build_fleet_table
+from metrics import registry, timed
+
+# Spalten, die app.py und ml_utils.py wirklich brauchen, mit dem Speicherformat im Fahrzeug-Store
+VEHICLE_COLUMNS = {
+    "Make": "category",
+    "Model": "category",
+    "Fuel_Type1": "category",
+    "Year": "int16",
+    "Cylinders": "float32",
+    "Co2__Tailpipe_For_Fuel_Type1": "float32",
+    "Combined_Mpg_For_Fuel_Type1": "float32",
+    "GHG_Score": "float32",
+}
+REQUIRED_COLUMNS = ["Make", "Fuel_Type1", "Model", "Year", "Co2__Tailpipe_For_Fuel_Type1"]    # Ohne diese Werte ist eine Zeile unbrauchbar
+STORE_DIR = ".vehicle_store"    # Ordner (neben der CSV), in dem der kompilierte Store liegt
+STORE_VERSION = 1    # Erhöhen, wenn sich das Format des Stores ändert
+
+# Karteneinstellungen
+MAP_MAX_POINTS = 2000    # Höchstzahl von Routenpunkten, die an den Browser geschickt werden
+MAP_PIXEL_TOLERANCE = 1.0    # Erlaubte Abweichung der vereinfachten Linie in Bildschirmpixeln
+MAP_ZOOM_HEADROOM = 2    # So viele Zoomstufen hineinzoomen, bevor die Vereinfachung sichtbar wird
+MAP_SIZE_PX = (700, 500)    # Ungefähre Kartengröße (Breite, Höhe) für die Zoomberechnung
 
 # HILFSFUNKTIONEN 
-# Dieser Dekorator sagt Streamlit, das Ergebnis der Funktion zwischenzuspeichern, damit es beim erneuten Aufruf schneller geht
-@st.cache_data
+def _clean_column(name: str) -> str:
+    return name.strip().replace(" ", "_")    # Gleiche Bereinigung wie früher für alle Spaltennamen
+
+@timed("utils.file_hash")
+def file_hash(path: str) -> str:
+    """
+    Compute the SHA-256 content hash of a file.
+
+    The digest is remembered in a small sidecar file keyed by size and
+    modification time, so unchanged files are not re-read on every start.
+
+    Parameters:
+        path (str): Path to the file.
+
+    Returns:
+        str: Hex digest of the file content.
+    """
+    stat = os.stat(path)
+    sidecar = os.path.join(os.path.dirname(os.path.abspath(path)), STORE_DIR, os.path.basename(path) + ".hash.json")
+    try:
+        with open(sidecar, encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["sha256"]    # Datei unverändert: gespeicherten Hash wiederverwenden
+    except (OSError, ValueError, KeyError):
+        pass
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):    # In 1-MB-Blöcken lesen, damit der Speicher klein bleibt
+            digest.update(block)
+    sha = digest.hexdigest()
+    try:
+        os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+        with open(sidecar, "w", encoding="utf-8") as f:
+            json.dump({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha}, f)
+    except OSError:
+        pass    # Schreibgeschützter Ordner: Hash wird dann einfach jedes Mal neu berechnet
+    return sha
+
+@timed("utils.read_vehicle_csv")
+def read_vehicle_csv(path: str) -> pd.DataFrame:
+    """
+    Parse the raw vehicle CSV into a compact, cleaned DataFrame.
+
+    Only the columns listed in VEHICLE_COLUMNS are read. Make, model and
+    fuel type become categoricals and numeric columns are downcast.
+
+    Parameters:
+        path (str): Path to the CSV file.
+
+    Returns:
+        pd.DataFrame: Cleaned DataFrame with compact dtypes.
+    """
+    df = pd.read_csv(
+        path,
+        sep=";",
+        encoding="utf-8-sig",
+        usecols=lambda c: _clean_column(c) in VEHICLE_COLUMNS,    # Nur benötigte Spalten parsen
+    )
+    df.columns = [_clean_column(c) for c in df.columns]    # Bereinige die Spaltennamen: entferne Leerzeichen und ersetze sie durch Unterstriche
+    df = df.dropna(subset=REQUIRED_COLUMNS).reset_index(drop=True)    # Entferne Zeilen, bei denen wichtige Informationen fehlen
+    for col, dtype in VEHICLE_COLUMNS.items():
+        if col not in df:
+            continue    # Optionale Spalte fehlt in dieser CSV-Version
+        if dtype == "category":
+            df[col] = df[col].astype(str).astype("category")
+        else:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(dtype)
+    return df
+
+@timed("utils.build_vehicle_store")
+def build_vehicle_store(path: str) -> str:
+    """
+    Compile the vehicle CSV into a memory-mappable NumPy store.
+
+    The store is a directory of one .npy file per column plus a meta.json
+    with the categories, named after the CSV's content hash. Building is
+    skipped when a store for the current content already exists.
+
+    Parameters:
+        path (str): Path to the CSV file.
+
+    Returns:
+        str: Path of the store directory.
+    """
+    sha = file_hash(path)
+    root = os.path.join(os.path.dirname(os.path.abspath(path)), STORE_DIR)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    store = os.path.join(root, f"{stem}-v{STORE_VERSION}-{sha[:16]}")
+    if os.path.exists(os.path.join(store, "meta.json")):
+        return store    # Schon gebaut
+
+    df = read_vehicle_csv(path)
+    os.makedirs(root, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".build-", dir=root)    # Erst in einen temporären Ordner schreiben, damit andere Prozesse nie einen halben Store sehen
+    meta = {"version": STORE_VERSION, "sha256": sha, "rows": len(df), "columns": {}}
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            codes = df[col].cat.codes.to_numpy()
+            np.save(os.path.join(tmp, f"{col}.npy"), codes)
+            meta["columns"][col] = {"dtype": "category", "categories": df[col].cat.categories.tolist()}
+        else:
+            np.save(os.path.join(tmp, f"{col}.npy"), df[col].to_numpy())
+            meta["columns"][col] = {"dtype": str(df[col].dtype)}
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    try:
+        os.replace(tmp, store)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)    # Ein anderer Prozess war schneller, sein Store wird benutzt
+    return store
+
+@timed("utils.open_vehicle_store")
+def open_vehicle_store(store: str) -> pd.DataFrame:
+    """
+    Open a compiled vehicle store as a DataFrame backed by memory maps.
+
+    Parameters:
+        store (str): Path of the store directory.
+
+    Returns:
+        pd.DataFrame: Vehicle data with categorical and downcast columns.
+    """
+    with open(os.path.join(store, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    columns = {}
+    for col, info in meta["columns"].items():
+        values = np.load(os.path.join(store, f"{col}.npy"), mmap_mode="r")    # Memory-Map: das Betriebssystem teilt die Seiten zwischen allen Prozessen
+        if info["dtype"] == "category":
+            columns[col] = pd.Categorical.from_codes(values, categories=info["categories"])
+        else:
+            columns[col] = values
+    df = pd.DataFrame(columns, copy=False)
+    df.attrs["source_hash"] = meta["sha256"]    # Inhalts-Hash der CSV, damit nachgelagerte Caches darauf aufbauen können
+    return df
+
+# Dieser Dekorator hält das Ergebnis einmal pro Prozess im Speicher. Anders als st.cache_data wird das DataFrame nicht bei jedem Aufruf kopiert, sodass die Memory-Maps erhalten bleiben
+@st.cache_resource
+@timed("utils.load_vehicle_data")
 def load_vehicle_data(path: str) -> pd.DataFrame:
     """
-    Load and clean a vehicle dataset from a CSV file.
+    Load the cleaned vehicle dataset, compiling the CSV into a store on first use.
 
     Parameters:
         path (str): Path to the CSV file.
 
     Returns:
         pd.DataFrame: Cleaned DataFrame with essential columns retained.
+            The frame is shared between sessions and must not be modified.
+    """
+    try:
+        return open_vehicle_store(build_vehicle_store(path))
+    except OSError:
+        df = read_vehicle_csv(path)    # Kein Schreibzugriff für den Store: direkt aus der CSV lesen
+        df.attrs["source_hash"] = file_hash(path)
+        return df
+
+@timed("utils.vehicle_keys")
+def vehicle_keys(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Map every catalogue key (make, fuel, model, year) to one row of the dataset.
+
+    Parameters:
+        df (pd.DataFrame): Cleaned vehicle dataset.
+
+    Returns:
+        pd.DataFrame: Columns 'Make', 'Fuel_Type1', 'Model' (str), 'Year' and
+                      'pos' (row position of the first matching vehicle in df),
+                      one row per key.
+    """
+    keys = pd.DataFrame({
+        "Make": df["Make"].astype(str).to_numpy(),
+        "Fuel_Type1": df["Fuel_Type1"].astype(str).to_numpy(),
+        "Model": df["Model"].astype(str).to_numpy(),
+        "Year": df["Year"].to_numpy(),
+        "pos": np.arange(len(df)),    # Zeilenposition im ursprünglichen DataFrame
+    })
+    return keys.drop_duplicates(subset=["Make", "Fuel_Type1", "Model", "Year"], keep="first")    # Wie früher final_row.iloc[0]: erste passende Zeile gewinnt
+
+@timed("utils.build_vehicle_index")
+def build_vehicle_index(df: pd.DataFrame) -> dict:
+    """
+    Build the nested lookup used by the Make -> Fuel -> Model -> Year picker.
+
+    Each level is a dict whose keys are already in display order (makes,
+    fuels and models ascending, years descending), so the options for a
+    dropdown are simply list(level). The innermost dict maps a year to the
+    row position of the first matching vehicle in df.
+
+    Parameters:
+        df (pd.DataFrame): Cleaned vehicle dataset.
+
+    Returns:
+        dict: {make: {fuel: {model: {year: row_position}}}}
     """
-    df = pd.read_csv(path, sep=";", encoding="utf-8-sig", engine="python")     # Lese die CSV-Datei in ein DataFrame (wie eine Tabelle im Code)
-    df.columns = df.columns.str.strip().str.replace(" ", "_")    # Bereinige die Spaltennamen: entferne Leerzeichen und ersetze sie durch Unterstriche
-    return df.dropna(    # Entferne Zeilen, bei denen wichtige Informationen fehlen
-        subset=[
-            "Make",     
-            "Fuel_Type1",   
-            "Model",     
-            "Year",    
-            "Co2__Tailpipe_For_Fuel_Type1"    
-        ]
+    keys = vehicle_keys(df).sort_values(
+        ["Make", "Fuel_Type1", "Model", "Year"],
+        ascending=[True, True, True, False],    # Baujahre absteigend, wie im Dropdown
+        kind="stable"
     )
+    index = {}
+    for make, fuel, model, year, pos in zip(
+        keys["Make"].tolist(), keys["Fuel_Type1"].tolist(), keys["Model"].tolist(),
+        keys["Year"].tolist(), keys["pos"].tolist()
+    ):
+        index.setdefault(make, {}).setdefault(fuel, {}).setdefault(model, {})[int(year)] = pos    # Dicts behalten die sortierte Einfügereihenfolge
+    return index
+
+# Einmal pro Prozess aufbauen; der Schlüssel ist nur der Pfad, damit das DataFrame nicht bei jedem Rerun gehasht wird
+@st.cache_resource
+@timed("utils.load_vehicle_index")
+def load_vehicle_index(path: str) -> dict:
+    """
+    Load the cached vehicle picker index for a vehicle CSV.
+
+    Parameters:
+        path (str): Path to the CSV file.
+
+    Returns:
+        dict: Index as returned by build_vehicle_index.
+    """
+    return build_vehicle_index(load_vehicle_data(path))
+
+# Einmal pro Prozess aufbauen, wie der Fahrzeugindex
+@st.cache_resource
+@timed("utils.load_fleet_table")
+def load_fleet_table(path: str) -> dict:
+    """
+    Load the cached whole-catalogue emission table for a vehicle CSV.
 
-def display_route_map(route: dict):
+    Parameters:
+        path (str): Path to the CSV file.
+
+    Returns:
+        dict: Table as returned by emissions.build_fleet_table.
     """
-    Visualize a route using PyDeck with line segments between coordinates.
+    return build_fleet_table(load_vehicle_data(path))
+
+@timed("utils.simplify_line")
+def simplify_line(coords: np.ndarray, tolerance: float, max_points: int = None) -> np.ndarray:
+    """
+    Simplify a polyline with the Douglas-Peucker algorithm.
+
+    Distances are measured in degrees of latitude, with longitudes scaled by
+    the cosine of the mean latitude. Each kept point gets a significance
+    (its Douglas-Peucker distance), so a point budget simply keeps the
+    most significant points.
+
+    Parameters:
+        coords (np.ndarray): Array of shape (n, 2) with [longitude, latitude] points.
+        tolerance (float): Maximum deviation of the simplified line, in degrees of latitude.
+        max_points (int, optional): Upper bound on the number of returned points,
+            at least 2 (start and end).
+
+    Returns:
+        np.ndarray: The kept points, in route order. First and last point are always kept.
+
+    Raises:
+        ValueError: If max_points is smaller than 2.
+    """
+    if max_points is not None and max_points < 2:
+        raise ValueError(f"max_points must be at least 2 (start and end), got {max_points}")    # argpartition(...)[-0:] würde sonst alle Punkte behalten
+    n = len(coords)
+    if n < 3:
+        return coords
+    pts = np.column_stack([coords[:, 0] * np.cos(np.radians(coords[:, 1].mean())), coords[:, 1]])    # Ebene Näherung
+    significance = np.zeros(n)
+    significance[[0, -1]] = np.inf    # Start und Ziel bleiben immer erhalten
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        i, j, parent = stack.pop()
+        if j - i < 2:
+            continue
+        a, b = pts[i], pts[j]
+        ab = b - a
+        rel = pts[i + 1:j] - a
+        length = np.hypot(ab[0], ab[1])
+        if length > 0:
+            dist = np.abs(ab[0] * rel[:, 1] - ab[1] * rel[:, 0]) / length    # Abstand zur Geraden a-b (alle Punkte auf einmal)
+        else:
+            dist = np.hypot(rel[:, 0], rel[:, 1])    # Geschlossene Schleife: Abstand zum Punkt a
+        k = int(np.argmax(dist))
+        d = dist[k]
+        if d <= tolerance:
+            continue    # Alle Zwischenpunkte können weg
+        k += i + 1
+        significance[k] = min(d, parent)    # Nie wichtiger als der Punkt, der den Abschnitt geteilt hat
+        stack.append((i, k, significance[k]))
+        stack.append((k, j, significance[k]))
+    keep = np.flatnonzero(significance > 0)
+    if max_points is not None and len(keep) > max_points:
+        keep = np.sort(np.argpartition(significance, -max_points)[-max_points:])    # Die wichtigsten Punkte behalten
+    return coords[keep]
+
+@timed("utils.fit_zoom")
+def fit_zoom(lon_min: float, lon_max: float, lat_min: float, lat_max: float, size_px=MAP_SIZE_PX) -> float:
+    """
+    Find the web-map zoom level at which a bounding box fills the map.
+
+    Parameters:
+        lon_min, lon_max, lat_min, lat_max (float): Bounding box in degrees.
+        size_px (tuple): Map size (width, height) in pixels.
+
+    Returns:
+        float: Zoom level between 1 and 15.
+    """
+    cos_lat = np.cos(np.radians((lat_min + lat_max) / 2))
+    with np.errstate(divide="ignore"):
+        zoom_x = np.log2(size_px[0] * 360 / (256 * max(lon_max - lon_min, 1e-9)))
+        zoom_y = np.log2(size_px[1] * 360 * cos_lat / (256 * max(lat_max - lat_min, 1e-9)))    # Mercator: Breitengrade werden mit 1/cos gestreckt
+    return float(np.clip(min(zoom_x, zoom_y), 1, 15))
+
+@timed("utils.prepare_route_path")
+def prepare_route_path(coords, max_points: int = MAP_MAX_POINTS) -> dict:
+    """
+    Compute the map view for a route and simplify its geometry for display.
+
+    The route is simplified to what is visible at the initial zoom (plus
+    MAP_ZOOM_HEADROOM levels) and to at most max_points points.
+
+    Parameters:
+        coords (array-like): [longitude, latitude] points of the route.
+        max_points (int): Maximum number of points to keep.
+
+    Returns:
+        dict: 'center_lat', 'center_lon', 'zoom' and 'path' (np.ndarray of kept points).
+    """
+    coords = np.asarray(coords, dtype=float)
+
+    # Karte zentrieren und Zoom so wählen, dass die ganze Route sichtbar ist
+    lon_min, lat_min = coords.min(axis=0)
+    lon_max, lat_max = coords.max(axis=0)
+    center_lat = (lat_min + lat_max) / 2    # Finde den Mittelpunkt der Route (Breite)
+    center_lon = (lon_min + lon_max) / 2    # Finde den Mittelpunkt der Route (Länge)
+    zoom = fit_zoom(lon_min, lon_max, lat_min, lat_max)
+
+    # Ein Pixel bei der feinsten vorgesehenen Zoomstufe, umgerechnet in Breitengrade
+    degrees_per_px = 360 * np.cos(np.radians(center_lat)) / (256 * 2 ** (zoom + MAP_ZOOM_HEADROOM))
+    path = simplify_line(coords, MAP_PIXEL_TOLERANCE * degrees_per_px, max_points)
+    return {"center_lat": float(center_lat), "center_lon": float(center_lon), "zoom": zoom, "path": path}
+
+@timed("utils.display_route_map")
+def display_route_map(route: dict, max_points: int = MAP_MAX_POINTS):
+    """
+    Visualize a route using PyDeck as a single simplified path.
+
+    The geometry is prepared by prepare_route_path, so the map payload
+    stays small for any route length.
 
     Parameters:
         route (dict): Dictionary containing route geometry with 'geometry' key
                       as a list of [longitude, latitude] points.
+        max_points (int): Maximum number of points sent to the browser.
     """
-    # Bereite das Koordinaten-DataFrame vor
-    coords = [[lat, lon] for lon, lat in route["geometry"]]
-    df = pd.DataFrame(coords, columns=["lat", "lon"])    # Lege die Koordinaten in ein DataFrame, damit PyDeck sie nutzen kann
-    
-    # Erstelle neue Spalten mit dem nächsten Punkt auf der Route, um Linien zwischen den Punkten zu zeichnen
-    df["lon_next"] = df["lon"].shift(-1)
-    df["lat_next"] = df["lat"].shift(-1)
-    df = df.dropna() # Entferne alle Zeilen mit fehlenden Daten
-
-    # Karte zentrieren
-    center_lat = (df["lat"].min() + df["lat"].max()) / 2    # Finde den Mittelpunkt der Route für korrekten Zoom (Breite)
-    center_lon = (df["lon"].min() + df["lon"].max()) / 2    # Finde den Mittelpunkt der Route für korrekten Zoom (Länge)
-    view = pdk.ViewState(latitude=center_lat, longitude=center_lon, zoom=7)
-
-    # Linien-Layer für Route
-    layer = pdk.Layer(   
-        "LineLayer",    # Sagt PyDeck, Linien zu zeichnen
-        data=df,     # Nutze unsere Routendaten
-        get_source_position=["lon", "lat"],    # Start jeder Linie
-        get_target_position=["lon_next", "lat_next"],    # Ende jeder Linie
-        get_color=[0, 0, 255],    # Blaue Linien (RGB)
-        get_width=4     # Liniendicke
+    import pydeck as pdk    # Erst hier importieren, damit der Start der App schneller ist
+    prepared = prepare_route_path(route["geometry"], max_points)
+    view = pdk.ViewState(latitude=prepared["center_lat"], longitude=prepared["center_lon"], zoom=prepared["zoom"])
+    path = prepared["path"]
+
+    # Pfad-Layer für Route: ein einziger Linienzug statt eines Segments pro Punktpaar
+    layer = pdk.Layer(
+        "PathLayer",    # Sagt PyDeck, einen Linienzug zu zeichnen
+        data=[{"path": path.tolist()}],     # Nutze unsere vereinfachten Routendaten
+        get_path="path",
+        get_color=[0, 0, 255],    # Blaue Linie (RGB)
+        get_width=4,     # Liniendicke
+        width_units="pixels"
     )
 
     # Zeige die Karte in der Streamlit-App
@@ -67,4 +409,32 @@ def display_route_map(route: dict):
             map_style="mapbox://styles/mapbox/satellite-streets-v11"     # Kartenstil
         )
     )
-    
\ No newline at end of file
+
+def display_diagnostics():
+    """
+    Show the collected timing, error and cache metrics in an expander.
+
+    Includes a download of the same data in Prometheus text format.
+    """
+    snap = registry.snapshot()
+    with st.expander("Diagnostics"):
+        if snap["histograms"]:
+            st.subheader("Timings")
+            st.dataframe(pd.DataFrame([
+                {
+                    "metric": h["name"],
+                    "labels": ", ".join(f"{k}={v}" for k, v in h["labels"].items()),
+                    "calls": h["count"],
+                    "mean (ms)": round(h["mean"] * 1000, 2),
+                    "total (s)": round(h["sum"], 3),
+                }
+                for h in snap["histograms"]
+            ]), hide_index=True)    # Eine Zeile pro Funktion bzw. API-Endpunkt
+        for title, key in [("Counters", "counters"), ("Gauges", "gauges")]:
+            if snap[key]:
+                st.subheader(title)
+                st.dataframe(pd.DataFrame([
+                    {"metric": c["name"], "labels": ", ".join(f"{k}={v}" for k, v in c["labels"].items()), "value": c["value"]}
+                    for c in snap[key]
+                ]), hide_index=True)
+        st.download_button("Download Prometheus metrics", registry.export_prometheus(), file_name="metrics.prom")
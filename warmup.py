@@ -0,0 +1,59 @@
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from metrics import registry, timed
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="warmup")
+
+
+@timed("warmup.warm_caches")
+def warm_caches(path: str):
+    """
+    Fill the per-process caches for the vehicle data and the CO2 model.
+
+    Parameters:
+        path (str): Path to the vehicle CSV.
+    """
+    from utils import load_vehicle_data, load_vehicle_index, load_fleet_table
+    from ml_utils import train_model, load_prediction_grid
+    df = load_vehicle_data(path)
+    load_vehicle_index(path)
+    load_fleet_table(path)
+    model, le = train_model(df)    # Importiert scikit-learn und lädt (oder trainiert) das Modell
+    load_prediction_grid(model, le, id(model))
+
+
+# Einmal pro Prozess starten; spätere Sitzungen bekommen denselben Future zurück
+@st.cache_resource
+def start_warmup(path: str):
+    """
+    Start filling the caches in a background thread.
+
+    Calls of the cached loaders from the script wait for the running
+    computation instead of repeating it, so the page can render
+    everything that does not need the data in the meantime.
+
+    Parameters:
+        path (str): Path to the vehicle CSV.
+
+    Returns:
+        concurrent.futures.Future: Completes when the caches are warm.
+    """
+    return _executor.submit(warm_caches, path)
+
+
+# Der Unterstrich schließt den Wert vom Cache-Schlüssel aus: nur der erste Aufruf im Prozess wird gespeichert
+@st.cache_resource(show_spinner=False)
+def record_first_paint(_seconds: float) -> float:
+    """
+    Record the cold-start time to first paint, once per process.
+
+    Later reruns (widget interactions) hit the cache and record nothing.
+
+    Parameters:
+        _seconds (float): Time from the start of the first script run until the title is shown.
+
+    Returns:
+        float: The recorded time.
+    """
+    registry.observe("co2_app_first_paint_seconds", _seconds)
+    return _seconds